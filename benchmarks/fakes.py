@@ -0,0 +1,249 @@
+"""
+ベンチマーク用のローカル代替実装
+
+Discord CDN・Gemini・Google Sheetsの代わりに使い、
+外部サービスに接続せずにボットの処理を計測できるようにする。
+"""
+import asyncio
+import io
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from aiohttp import web
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+from src.services.meal_record import MEAL_HEADERS
+
+CATEGORIES = ["朝食", "昼食", "夕食", "間食", "その他"]
+
+
+def generate_image(seed: int, size=(1280, 960), quality: int = 85) -> bytes:
+    """ノイズ入りのJPEG画像を生成（seedごとに異なるハッシュになる）"""
+    rng = random.Random(seed)
+    channels = [Image.effect_noise(size, rng.uniform(20, 80)) for _ in range(3)]
+    image = Image.merge("RGB", channels)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class FakeCDN:
+    """
+    テスト画像を配信するaiohttpサーバー（Discord CDNの代わり）
+
+    /images/{n}.jpg にアクセスすると、latency秒待ってからn番の画像を返す。
+    画像は初回アクセス時に生成してメモリに保持する。
+    """
+
+    def __init__(self, latency: float = 0.05, image_size=(1280, 960)):
+        self.latency = latency
+        self.image_size = image_size
+        self.requests = 0
+        self._images: Dict[int, bytes] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    def image(self, n: int) -> bytes:
+        if n not in self._images:
+            self._images[n] = generate_image(n, self.image_size)
+        return self._images[n]
+
+    def url(self, n: int) -> str:
+        return f"{self.base_url}/images/{n}.jpg"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        n = int(request.match_info["n"])
+        return web.Response(body=self.image(n), content_type="image/jpeg")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/images/{n:\\d+}.jpg", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    """ストリーミング応答（チャンクを一定間隔で返す）"""
+
+    def __init__(self, chunks: List[str], interval: float):
+        self.chunks = chunks
+        self.interval = interval
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i:
+                await asyncio.sleep(self.interval)
+            yield FakeResponse(chunk)
+
+
+class FakeGeminiModel:
+    """
+    GenerativeModelの代わりに固定形式のJSONを返すモデル
+
+    latency秒（±jitterの揺らぎ付き）待ってから応答し、
+    error_rateの確率で、また最初の呼び出しからoutage秒の間はすべての呼び出しで
+    503（ServiceUnavailable）を送出する。generation_configでJSONのMIMEタイプが
+    指定されていればJSONだけを返し、指定がなければコードブロックで囲んで返す。
+    応答スキーマも指定されていれば、実際のGeminiと同じく項目をアルファベット順に並べる。
+    malformed_rateの確率で前後に説明文を付け、数値を"約500"のような文字列にする。
+    stream=Trueの場合は
+    latencyのfirst_chunk_ratio倍の時間で最初のチャンクを返し、
+    残りの時間で残りのチャンクを返す。
+    """
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, error_rate: float = 0.0, seed: int = 0,
+                 stream_chunks: int = 8, first_chunk_ratio: float = 0.3, malformed_rate: float = 0.0,
+                 outage: float = 0.0):
+        self.latency = latency
+        self.outage = outage
+        self._first_call: Optional[float] = None
+        self.malformed_rate = malformed_rate
+        self.stream_chunks = stream_chunks
+        self.first_chunk_ratio = first_chunk_ratio
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def _result(self) -> Dict:
+        rng = self._rng
+        return {
+            "meal_description": "ベンチマーク用の食事",
+            "estimated_calories": rng.randint(200, 1200),
+            "nutrients": {
+                "carbohydrates": round(rng.uniform(10, 120), 1),
+                "protein": round(rng.uniform(5, 50), 1),
+                "fat": round(rng.uniform(5, 40), 1),
+                "fiber": round(rng.uniform(0, 10), 1),
+                "sodium": rng.randint(100, 2500)
+            },
+            "meal_category": rng.choice(CATEGORIES),
+            "health_notes": "バランスの良い食事です。"
+        }
+
+    def _format(self, payload, structured: bool, sort_keys: bool = False) -> str:
+        if self._rng.random() < self.malformed_rate:
+            items = payload if isinstance(payload, list) else [payload]
+            for item in items:
+                item["estimated_calories"] = f"約{item['estimated_calories']}"
+                item["nutrients"]["sodium"] = f"{item['nutrients']['sodium']}mg"
+            body = json.dumps(payload, ensure_ascii=False, indent=2)
+            return f"分析結果は以下のとおりです。\n{body}\n数値は推定値です。"
+        body = json.dumps(payload, ensure_ascii=False, indent=2, sort_keys=sort_keys)
+        return body if structured else "```json\n" + body + "\n```"
+
+    async def generate_content_async(self, contents: List, generation_config=None, stream: bool = False,
+                                     request_options: Optional[Dict] = None):
+        self.calls += 1
+        if self._first_call is None:
+            self._first_call = time.monotonic()
+        delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(delay * self.first_chunk_ratio if stream else delay)
+        in_outage = time.monotonic() - self._first_call < self.outage
+        if in_outage or self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise google_exceptions.ServiceUnavailable("fake Gemini error")
+
+        # 画像が複数あれば一括分析としてJSON配列で返す
+        image_count = sum(1 for c in contents if isinstance(c, dict))
+        if image_count > 1:
+            payload = [self._result() for _ in range(image_count)]
+        else:
+            payload = self._result()
+        structured = getattr(generation_config, "response_mime_type", None) == "application/json"
+        text = self._format(payload, structured, getattr(generation_config, "response_schema", None) is not None)
+        if not stream:
+            return FakeResponse(text)
+
+        size = -(-len(text) // self.stream_chunks)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        interval = delay * (1 - self.first_chunk_ratio) / max(len(chunks) - 1, 1)
+        return FakeStream(chunks, interval)
+
+
+class FakeWorksheet:
+    """
+    gspreadのWorksheet互換のメモリ上のシート
+
+    SheetsServiceが使うappend_rows / get_values / batch_getだけを実装する。
+    各呼び出しはlatency秒ブロックする（SheetsExecutorのスレッド上で実行される）。
+    """
+
+    _RANGE = re.compile(r"([A-Z])(\d+):([A-Z])(\d*)")
+
+    def __init__(self, title: str = "食事記録", rows: Optional[List[List]] = None, latency: float = 0.2):
+        self.title = title
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._rows: List[List] = [list(MEAL_HEADERS)] + [list(r) for r in rows or []]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows) - 1
+
+    def _wait(self, operation: str):
+        self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get_range(self, range_name: str) -> List[List]:
+        match = self._RANGE.fullmatch(range_name)
+        if not match:
+            raise ValueError(f"unsupported range: {range_name}")
+        first_col, start, last_col, end = match.groups()
+        start = int(start)
+        end = int(end) if end else len(self._rows)
+        cols = slice(ord(first_col) - ord("A"), ord(last_col) - ord("A") + 1)
+        return [list(r[cols]) for r in self._rows[start - 1:end]]
+
+    def append_rows(self, values: List[List], **kwargs) -> Dict:
+        self._wait("append_rows")
+        with self._lock:
+            start = len(self._rows) + 1
+            self._rows.extend(list(r) for r in values)
+        end = start + len(values) - 1
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:L{end}", "updatedRows": len(values)}}
+
+    def get_values(self, range_name: str = "A1:L", **kwargs) -> List[List]:
+        self._wait("get_values")
+        with self._lock:
+            return self._get_range(range_name)
+
+    def batch_get(self, ranges: List[str], **kwargs) -> List[List[List]]:
+        self._wait("batch_get")
+        with self._lock:
+            return [self._get_range(r) for r in ranges]
+
+
+class FakeSpreadsheet:
+    """gspreadのSpreadsheet互換（ワークシートの一覧と取得のみ）"""
+
+    def __init__(self, worksheets: List[FakeWorksheet]):
+        self._worksheets = {ws.title: ws for ws in worksheets}
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        return list(self._worksheets.values())
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        return self._worksheets[title]
@@ -0,0 +1,129 @@
+"""
+画像前処理のベンチマーク
+
+同じ食事画像を長辺サイズごとに縮小してGeminiで分析し、
+送信サイズ・応答時間・推定値（カロリー/栄養素）の変化を比較する。
+分析はBotと同じ非同期の呼び出し（GeminiService._generate、同じ生成設定）で行う。
+
+使い方:
+    python -m benchmarks.image_preprocess_benchmark <画像ディレクトリ> [--sizes 0,2048,1536,1024,768,512]
+
+    サイズ0は縮小なし（元画像をそのまま送信）を表し、比較の基準になる。
+    実際にGemini APIを呼び出すため、.envのGEMINI_API_KEYが必要。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+from src.services.gemini_service import GeminiService
+from src.services.meal_record import to_number
+from src.utils.image_utils import MIME_TYPES, preprocess_image
+from src.utils.json_utils import extract_json
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+NUTRIENT_KEYS = ("carbohydrates", "protein", "fat")
+
+
+def parse_result(text: str) -> Dict:
+    """応答からJSONを取り出す（取り出せない場合は空の辞書）"""
+    try:
+        result = extract_json(text, "{")
+    except json.JSONDecodeError:
+        return {}
+    return result if isinstance(result, dict) else {}
+
+
+def relative_error(value: float, baseline: float) -> float:
+    if baseline == 0:
+        return 0.0 if value == 0 else 1.0
+    return abs(value - baseline) / baseline
+
+
+async def run(image_dir: str, sizes: List[int]):
+    service = GeminiService()
+    try:
+        await measure(service, image_dir, sizes)
+    finally:
+        await service.close()
+
+
+async def measure(service: GeminiService, image_dir: str, sizes: List[int]):
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print("画像が見つかりません")
+        return
+
+    # results[size][path] = {...}
+    results: Dict[int, Dict[str, Dict]] = {size: {} for size in sizes}
+    for path in paths:
+        with open(path, 'rb') as f:
+            image_data = f.read()
+
+        for size in sizes:
+            if size:
+                data, mime_type, prep_stats = preprocess_image(image_data, max_edge=size)
+            else:
+                data = image_data
+                ext = os.path.splitext(path)[1].lstrip('.').upper()
+                mime_type = MIME_TYPES.get('JPEG' if ext == 'JPG' else ext, 'image/jpeg')
+                prep_stats = {"elapsed": 0.0}
+
+            start = time.perf_counter()
+            response = await service._generate(
+                [service.prompt_template, {"mime_type": mime_type, "data": data}],
+                generation_config=service.generation_config
+            )
+            latency = time.perf_counter() - start
+            parsed = parse_result(response.text)
+
+            results[size][path] = {
+                "bytes": len(data),
+                "preprocess": prep_stats["elapsed"],
+                "latency": latency,
+                "calories": to_number(parsed.get("estimated_calories")),
+                "nutrients": {k: to_number((parsed.get("nutrients") or {}).get(k)) for k in NUTRIENT_KEYS}
+            }
+            print(f"{os.path.basename(path)} size={size or 'original'} "
+                  f"{len(data) / 1024:.0f}KB {latency:.2f}s {results[size][path]['calories']:.0f}kcal")
+
+    baseline = results[sizes[0]]
+    print()
+    print(f"{'size':>8} {'avg KB':>8} {'prep s':>7} {'gemini s':>9} {'saved s':>8} {'kcal err':>9} "
+          + " ".join(f"{k[:5] + ' err':>10}" for k in NUTRIENT_KEYS))
+    for size in sizes:
+        rows = results[size]
+        avg_latency = statistics.mean(r["latency"] for r in rows.values())
+        base_latency = statistics.mean(r["latency"] for r in baseline.values())
+        kcal_err = statistics.mean(
+            relative_error(rows[p]["calories"], baseline[p]["calories"]) for p in paths
+        )
+        nutrient_err = [
+            statistics.mean(relative_error(rows[p]["nutrients"][k], baseline[p]["nutrients"][k]) for p in paths)
+            for k in NUTRIENT_KEYS
+        ]
+        print(f"{size or 'original':>8} "
+              f"{statistics.mean(r['bytes'] for r in rows.values()) / 1024:>8.0f} "
+              f"{statistics.mean(r['preprocess'] for r in rows.values()):>7.3f} "
+              f"{avg_latency:>9.2f} "
+              f"{base_latency - avg_latency:>8.2f} "
+              f"{kcal_err * 100:>8.1f}% "
+              + " ".join(f"{e * 100:>9.1f}%" for e in nutrient_err))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画像前処理サイズごとのGemini分析ベンチマーク")
+    parser.add_argument("image_dir", help="食事画像のディレクトリ")
+    parser.add_argument("--sizes", default="0,2048,1536,1024,768,512",
+                        help="比較する長辺サイズ（カンマ区切り、0は元画像）")
+    args = parser.parse_args()
+    asyncio.run(run(args.image_dir, [int(s) for s in args.sizes.split(",")]))
+
+
+if __name__ == "__main__":
+    main()
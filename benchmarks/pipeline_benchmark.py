@@ -0,0 +1,332 @@
+"""
+食事記録パイプラインとレポート生成のオフラインベンチマーク
+
+Discord CDN・Gemini・Google Sheetsをローカルの代替実装（benchmarks.fakes）に
+置き換え、実際のon_message → 分析キュー → Gemini → Sheets書き込みの流れと
+週次・月次レポートの生成時間を計測する。外部サービスには接続しない。
+
+使い方:
+    python -m benchmarks.pipeline_benchmark [--concurrency 1,4,16] [--messages 48]
+        [--cdn-latency 0.05] [--gemini-latency 1.0] [--gemini-error-rate 0] [--gemini-malformed-rate 0]
+        [--gemini-outage 0] [--circuit-recovery 60] [--discord-rate 1000] [--discord-burst 5]
+        [--sheets-latency 0.2] [--images-per-message 1] [--report-users 20]
+
+    投稿者数（同時実行数）ごとに、各投稿者が前の投稿の完了を待ってから
+    次の画像を投稿する。投稿から完了リアクションまでの時間を1件のレイテンシとし、
+    p50/p95/p99と1秒あたりの処理食事数、1投稿あたりのDiscord API呼び出し数を表示する。
+    --gemini-outageを指定すると最初の数秒間Geminiが503を返し続け、
+    サーキットブレーカーで後回しにした投稿が復旧後に分析されるまでを計測できる。
+"""
+import os
+import tempfile
+
+# src.configの読み込み前にローカルのDBと設定を差し替える
+_WORK_DIR = tempfile.mkdtemp(prefix="meal_bot_bench_")
+os.environ["MEAL_REPLICA_DB"] = os.path.join(_WORK_DIR, "meal_records.db")
+os.environ["SHEETS_JOURNAL_DB"] = os.path.join(_WORK_DIR, "sheets_journal.db")
+os.environ["ANALYSIS_CACHE_DB"] = ""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from benchmarks.fakes import CATEGORIES, FakeCDN, FakeGeminiModel, FakeSpreadsheet, FakeWorksheet
+from src.config.config import MEAL_CHANNEL_ID, TIMEZONE
+
+# 結果の返信の先頭に付く印（この印の付いた返信・編集で投稿の処理が完了したとみなす）
+FINAL_MARKS = ("✅", "❌", "⚠️")
+
+
+class FakeUser:
+    bot = True  # process_commandsでコマンド解析を行わせない
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+
+    def __str__(self) -> str:
+        return self.display_name
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, url: str):
+        self.filename = filename
+        self.url = url
+
+
+class FakeStatusMessage:
+    _next_id = 0
+
+    def __init__(self, channel: "FakeChannel"):
+        FakeStatusMessage._next_id += 1
+        self.id = FakeStatusMessage._next_id
+        self.channel = channel
+
+    async def edit(self, content: Optional[str] = None, **kwargs):
+        self.channel.calls["edit"] += 1
+        self.channel.observe(content)
+
+
+class FakeChannel:
+    """投稿先のチャンネル（送信・編集・入力中表示の回数を数える）"""
+
+    def __init__(self, channel_id: int = MEAL_CHANNEL_ID):
+        self.id = channel_id
+        self.calls = Counter()
+        self.posts: Dict[str, "FakeMessage"] = {}
+
+    @property
+    def sent(self) -> int:
+        return self.calls["send"]
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def observe(self, content: Optional[str]):
+        """結果の印とメンションから完了した投稿を探す（投稿者ごとに同時に1件のみ投稿する）"""
+        if not content or not content.startswith(FINAL_MARKS):
+            return
+        mark = next(m for m in FINAL_MARKS if content.startswith(m))
+        for mention, post in list(self.posts.items()):
+            if mention in content:
+                del self.posts[mention]
+                post.result = mark
+                post.done.set()
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        self.calls["send"] += 1
+        self.observe(content)
+        return FakeStatusMessage(self)
+
+    async def typing(self):
+        self.calls["typing"] += 1
+
+
+class FakeMessage:
+    """on_messageに渡す投稿（結果の印が付いた返信が送られたら完了とみなす）"""
+
+    def __init__(self, author: FakeUser, channel: FakeChannel, attachments: List[FakeAttachment]):
+        self.author = author
+        self.channel = channel
+        self.attachments = attachments
+        self.content = ""
+        self.done = asyncio.Event()
+        self.result: Optional[str] = None
+        channel.posts[author.mention] = self
+
+    async def add_reaction(self, emoji: str):
+        self.channel.calls["reaction"] += 1
+
+
+class FakeBot:
+    """ReportScheduler用のBot（チャンネルとユーザーの取得のみ）"""
+
+    def __init__(self):
+        self.channel = FakeChannel(0)
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channel
+
+    def get_user(self, user_id: int) -> FakeUser:
+        return FakeUser(user_id)
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        return FakeUser(user_id)
+
+
+def percentiles(values: List[float]) -> List[float]:
+    if not values:
+        return [0.0, 0.0, 0.0]
+    if len(values) == 1:
+        return [float(values[0])] * 3
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return [cuts[49], cuts[94], cuts[98]]
+
+
+def history_rows(users: int, days: int, meals_per_day: int = 3, seed: int = 0) -> List[List]:
+    """レポート計測用の過去の食事記録（シートの行形式）"""
+    rng = random.Random(seed)
+    now = datetime.now(TIMEZONE)
+    rows = []
+    for day in range(days, 0, -1):
+        date = now - timedelta(days=day)
+        for user in range(users):
+            for meal in range(meals_per_day):
+                recorded_at = date.replace(hour=7 + meal * 5, minute=rng.randint(0, 59), second=0)
+                rows.append([
+                    recorded_at.strftime("%Y-%m-%d %H:%M:%S"), str(1000 + user), "過去の食事",
+                    CATEGORIES[meal], rng.randint(300, 1000), rng.randint(30, 120), rng.randint(10, 45),
+                    rng.randint(5, 35), rng.randint(1, 8), rng.randint(300, 2000), "", ""
+                ])
+    return rows
+
+
+async def run_pipeline(bot_main, cdn: FakeCDN, concurrency: int, messages: int,
+                       images_per_message: int, image_offset: int):
+    """投稿者concurrency人でmessages件を投稿し、レイテンシを集計"""
+    channel = FakeChannel()
+    latencies: List[float] = []
+    results = []
+    per_poster = max(1, messages // concurrency)
+
+    async def poster(index: int):
+        author = FakeUser(index + 1)
+        for n in range(per_poster):
+            first = image_offset + (index * per_poster + n) * images_per_message
+            attachments = [
+                FakeAttachment(f"meal{i}.jpg", cdn.url(i))
+                for i in range(first, first + images_per_message)
+            ]
+            message = FakeMessage(author, channel, attachments)
+            start = time.perf_counter()
+            await bot_main.on_message(message)
+            await message.done.wait()
+            latencies.append(time.perf_counter() - start)
+            results.append(message.result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(poster(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    # Sheetsへの書き込みが追いつくまでの時間
+    drain_start = time.perf_counter()
+    writer = bot_main.services.sheets.write_buffer
+    while writer.pending:
+        await writer.flush()
+    drain = time.perf_counter() - drain_start
+
+    p50, p95, p99 = percentiles(latencies)
+    meals = len(latencies) * images_per_message
+    print(f"{concurrency:>6} {len(latencies):>5} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} "
+          f"{meals / elapsed:>10.2f} {results.count('✅'):>4} {len(results) - results.count('✅'):>4} "
+          f"{drain:>8.2f} {channel.api_calls / len(latencies):>8.2f}")
+    return per_poster * concurrency * images_per_message
+
+
+async def run_reports(sheets, report_service, worksheet: FakeWorksheet, users: int):
+    """週次・月次レポートの生成時間（初回とメモ化後）"""
+    from src.scheduler import ReportScheduler
+
+    worksheet._rows[1:1] = history_rows(users, 62)
+    start = time.perf_counter()
+    await sheets.sync_replica(full=True)
+    sync_time = time.perf_counter() - start
+
+    bot = FakeBot()
+    scheduler = ReportScheduler(bot, sheets, report_service)
+    print(f"\nレポート（{users}人、{len(worksheet)}行、レプリカ再構築 {sync_time:.2f}s）")
+    print(f"{'report':>8} {'cold s':>8} {'warm s':>8} {'sent':>5}")
+    for name, generate in (("weekly", scheduler.generate_weekly_report),
+                           ("monthly", scheduler.generate_monthly_report)):
+        sent_before = bot.channel.sent
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            await generate()
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>8} {timings[0]:>8.3f} {timings[1]:>8.3f} {(bot.channel.sent - sent_before) // 2:>5}")
+
+
+async def run(args):
+    import src.main as bot_main
+
+    cdn = FakeCDN(latency=args.cdn_latency)
+    await cdn.start()
+
+    services = bot_main.services
+    gemini = services.gemini
+    gemini.model = FakeGeminiModel(
+        latency=args.gemini_latency,
+        error_rate=args.gemini_error_rate,
+        malformed_rate=args.gemini_malformed_rate,
+        outage=args.gemini_outage
+    )
+    gemini.breaker.recovery_timeout = args.circuit_recovery
+
+    # Discordへの送信レート（既定は計測の妨げにならない値、実際の制限は --discord-rate 1 --discord-burst 5）
+    from src.utils.discord_outbox import TokenBucket, outbox
+    outbox.rate = args.discord_rate
+    outbox.burst = args.discord_burst
+    outbox._global = TokenBucket(max(args.discord_rate, 50.0), 50)
+
+    # 接続済みの状態にしてからメモリ上のシートを割り当てる
+    worksheet = FakeWorksheet(latency=args.sheets_latency)
+    sheets = services.sheets
+    sheets.sheet = FakeSpreadsheet([worksheet])
+    sheets._worksheets = {worksheet.title: worksheet}
+    await sheets.sync_replica(full=True)
+
+    bot_main.meal_queue.start()
+    sheets.start_writer()
+
+    print(f"CDN {args.cdn_latency}s / Gemini {args.gemini_latency}s (error {args.gemini_error_rate:.0%}) / "
+          f"Sheets {args.sheets_latency}s / 画像{args.images_per_message}枚/投稿")
+    print(f"{'posters':>6} {'posts':>5} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'meals/s':>10} "
+          f"{'ok':>4} {'ng':>4} {'drain s':>8} {'api/post':>8}")
+    offset = 0
+    for concurrency in args.concurrency:
+        offset += await run_pipeline(
+            bot_main, cdn, concurrency, args.messages, args.images_per_message, offset
+        )
+
+    api_calls = ", ".join(f"{op}={count}" for op, count in sorted(worksheet.calls.items()))
+    from src.utils.metrics import metrics
+    print(f"Gemini呼び出し: {gemini.model.calls}回（エラー {gemini.model.errors}回、"
+          f"再試行 {metrics.counter_total('gemini_retries_total'):.0f}回） / Sheets: {api_calls}")
+    transitions = ", ".join(
+        f"{state}={metrics.counter_value('circuit_transitions_total', service='Gemini', state=state):.0f}"
+        for state in ("open", "half_open", "closed")
+    )
+    print(f"Geminiサーキットブレーカーの遷移: {transitions} / "
+          f"後回し {bot_main.meal_queue.stats['deferred']}件")
+
+    # 処理段階ごとの内訳（全同時実行数の合計）
+    print(f"\n{'stage':>14} {'count':>6} {'mean s':>8} {'p50 s':>8} {'p95 s':>8}")
+    for labels, count, mean, p50, p95 in metrics.histogram_summary("stage_seconds"):
+        print(f"{labels['stage']:>14} {count:>6} {mean:>8.3f} {p50:>8.3f} {p95:>8.3f}")
+
+    await run_reports(sheets, services.report, worksheet, args.report_users)
+
+    await bot_main.meal_queue.stop()
+    await services.close()
+    await cdn.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="食事記録パイプラインのオフラインベンチマーク")
+    parser.add_argument("--concurrency", default="1,4,16", help="同時投稿者数（カンマ区切り）")
+    parser.add_argument("--messages", type=int, default=48, help="同時投稿者数ごとの投稿数")
+    parser.add_argument("--images-per-message", type=int, default=1)
+    parser.add_argument("--cdn-latency", type=float, default=0.05, help="画像配信の遅延（秒）")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Geminiの応答時間（秒）")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Geminiのエラー率（0-1）")
+    parser.add_argument("--gemini-malformed-rate", type=float, default=0.0,
+                        help="説明文付き・文字列の数値を含む応答の割合（0-1）")
+    parser.add_argument("--gemini-outage", type=float, default=0.0,
+                        help="最初の呼び出しからGeminiが503を返し続ける秒数")
+    parser.add_argument("--circuit-recovery", type=float, default=60.0,
+                        help="Geminiのサーキットブレーカーが開いている秒数")
+    parser.add_argument("--discord-rate", type=float, default=1000.0,
+                        help="チャンネルごとの送信・編集の毎秒の数")
+    parser.add_argument("--discord-burst", type=int, default=5, help="チャンネルごとに連続で送れる数")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="Sheets API呼び出しの遅延（秒）")
+    parser.add_argument("--report-users", type=int, default=20, help="レポート計測のユーザー数")
+    parser.add_argument("--verbose", action="store_true", help="ボットのログを表示")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    if not args.verbose:
+        from src.utils.logger import setup_logger
+        setup_logger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+レポート集計のベンチマーク
+
+辞書ベースの従来実装と、レプリカの日次集計（daily_rollups）からの集計で
+時間を比較し、結果が一致することを確認する。あわせてシートの列名をキーにした辞書と
+MealRecordの1件あたりのメモリ使用量を比較する。
+
+使い方:
+    python -m benchmarks.report_benchmark [--sizes 1000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+from src.services.meal_record import MEAL_HEADERS, MealRecord
+from src.services.meal_replica import MealReplica
+from src.services.report_service import ReportService
+
+CATEGORIES = ["朝食", "昼食", "夕食", "間食", "その他"]
+
+
+def legacy_analyze_nutrition_data(meal_records: List[Dict]) -> Dict:
+    """変更前のReportService.analyze_nutrition_data（比較用）"""
+    if not meal_records:
+        return {
+            "total_meals": 0,
+            "avg_calories": 0,
+            "avg_nutrients": {"carbohydrates": 0, "protein": 0, "fat": 0},
+            "total_nutrients": {"carbohydrates": 0, "protein": 0, "fat": 0},
+            "meal_distribution": {"朝食": 0, "昼食": 0, "夕食": 0, "間食": 0, "その他": 0}
+        }
+
+    calories = []
+    nutrients = {"carbohydrates": [], "protein": [], "fat": []}
+    meal_categories = {"朝食": 0, "昼食": 0, "夕食": 0, "間食": 0, "その他": 0}
+
+    for record in meal_records:
+        cal = float(record.get("推定カロリー", 0))
+        if cal > 0:
+            calories.append(cal)
+
+        carbs = float(record.get("炭水化物(g)", 0))
+        protein = float(record.get("タンパク質(g)", 0))
+        fat = float(record.get("脂質(g)", 0))
+
+        if carbs > 0:
+            nutrients["carbohydrates"].append(carbs)
+        if protein > 0:
+            nutrients["protein"].append(protein)
+        if fat > 0:
+            nutrients["fat"].append(fat)
+
+        category = record.get("カテゴリ", "その他")
+        if category in meal_categories:
+            meal_categories[category] += 1
+
+    avg_calories = statistics.mean(calories) if calories else 0
+    avg_nutrients = {
+        "carbohydrates": statistics.mean(nutrients["carbohydrates"]) if nutrients["carbohydrates"] else 0,
+        "protein": statistics.mean(nutrients["protein"]) if nutrients["protein"] else 0,
+        "fat": statistics.mean(nutrients["fat"]) if nutrients["fat"] else 0
+    }
+
+    total_nutrients = {
+        "carbohydrates": sum(nutrients["carbohydrates"]),
+        "protein": sum(nutrients["protein"]),
+        "fat": sum(nutrients["fat"])
+    }
+
+    return {
+        "total_meals": len(meal_records),
+        "avg_calories": round(avg_calories),
+        "avg_nutrients": {k: round(v, 1) for k, v in avg_nutrients.items()},
+        "total_nutrients": {k: round(v, 1) for k, v in total_nutrients.items()},
+        "meal_distribution": meal_categories,
+        "daily_avg_calories": round(sum(calories) / 7) if len(calories) > 0 else 0
+    }
+
+
+def generate_rows(count: int, seed: int = 0) -> List[List]:
+    """シートの行形式のダミー記録を生成"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        day = 1 + i % 28
+        rows.append([
+            f"2026-02-{day:02d} {rng.randint(6, 22):02d}:00:00", "1", "ダミーの食事", rng.choice(CATEGORIES),
+            rng.choice([0, rng.randint(100, 1500)]), round(rng.uniform(0, 150), 1), round(rng.uniform(0, 60), 1),
+            rng.choice([0, round(rng.uniform(0, 50), 1)]), round(rng.uniform(0, 10), 1), rng.randint(100, 2500),
+            "", ""
+        ])
+    return rows
+
+
+def generate_records(rows: List[List]) -> List[Dict]:
+    """get_all_records形式（シートの列名をキーにした辞書）に変換"""
+    return [dict(zip(MEAL_HEADERS, row)) for row in rows]
+
+
+def bytes_per_record(build, rows: List[List]) -> float:
+    """行から記録を作ったときの1件あたりの確保メモリ"""
+    tracemalloc.start()
+    records = build(rows)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size / len(rows)
+
+
+def measure(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes: List[int]):
+    service = ReportService()
+    work_dir = tempfile.mkdtemp(prefix="meal_bot_report_bench_")
+    print(f"{'rows':>10} {'dict B':>7} {'record B':>9} {'legacy s':>10} {'rebuild s':>10} "
+          f"{'query s':>8} {'aggregate s':>12} {'speedup':>8} {'equal':>6}")
+    for size in sizes:
+        rows = generate_rows(size)
+        records = generate_records(rows)
+        repeat = 3 if size <= 100000 else 1
+
+        dict_bytes = bytes_per_record(generate_records, rows[:100000])
+        record_bytes = bytes_per_record(lambda r: [MealRecord.from_row(row) for row in r], rows[:100000])
+        legacy_time = measure(legacy_analyze_nutrition_data, records, repeat=repeat)
+
+        # 日次集計は同期時に作られるため、レポート時の処理は参照と集計だけ
+        replica = MealReplica(os.path.join(work_dir, f"replica_{size}.db"))
+        rebuild_time = measure(replica.replace_all, rows, repeat=1)
+        query = (replica.query_rollups, "1", "2026-02-01", "2026-02-28")
+        query_time = measure(*query, repeat=repeat)
+        rollups = replica.query_rollups(*query[1:])
+        aggregate_time = measure(service.analyze_rollups, rollups, repeat=repeat)
+        replica.close()
+
+        equal = legacy_analyze_nutrition_data(records) == service.analyze_rollups(rollups)
+        report_time = query_time + aggregate_time
+        print(f"{size:>10} {dict_bytes:>7.0f} {record_bytes:>9.0f} {legacy_time:>10.4f} {rebuild_time:>10.2f} "
+              f"{query_time:>8.5f} {aggregate_time:>12.5f} {legacy_time / report_time:>7.1f}x {str(equal):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レポート集計のベンチマーク")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="行数（カンマ区切り）")
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")])
+
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,95 @@ MAX_RETRY_ATTEMPTS = 2
 IMAGE_ANALYSIS_TIMEOUT = 30  # seconds
 REPORT_GENERATION_TIMEOUT = 10  # seconds
 
+# 再試行の待ち時間（decorrelated jitter: 基準値〜直前の待ち時間の3倍からランダムに選ぶ）
+RETRY_BASE_DELAY = 1.0  # seconds
+GEMINI_RETRY_MAX_DELAY = 10.0  # seconds
+
+# サーキットブレーカー（連続して失敗したら一定時間その依存先を呼ばずに即座に失敗させる）
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))  # 開くまでの連続失敗回数
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', '60'))  # seconds（試行を再開するまで）
+# Gemini障害中に受け付けた投稿を後で分析し直す回数の上限
+MEAL_MAX_DEFERRALS = int(os.getenv('MEAL_MAX_DEFERRALS', '5'))
+
+# Gemini APIの同時リクエスト数上限
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+
+# Geminiの応答をストリーミングで受信し、途中経過をメッセージに表示するか
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', 'true').lower() == 'true'
+STREAM_EDIT_INTERVAL = 1.0  # seconds（途中経過の編集の最小間隔）
+
+# 応答をJSONスキーマで制約する構造化出力を使うか（非対応モデルではfalseにする）
+GEMINI_STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+
+# 複数画像の一括分析（1リクエストあたりの最大枚数、1で無効）
+GEMINI_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', '4'))
+# 複数画像の投稿を1食分として合算し1行で記録するか
+COMBINE_MULTI_IMAGE_MEALS = os.getenv('COMBINE_MULTI_IMAGE_MEALS', 'false').lower() == 'true'
+
+# 画像ダウンロード用HTTP接続プール設定
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '20'))  # 全体の最大同時接続数
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '10'))
+HTTP_DNS_CACHE_TTL = 300  # seconds
+IMAGE_DOWNLOAD_CONNECT_TIMEOUT = 10  # seconds（全体はIMAGE_ANALYSIS_TIMEOUT以内）
+
+# Geminiへ送る画像の前処理設定
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1024'))  # 長辺の最大ピクセル数
+IMAGE_UPLOAD_FORMAT = os.getenv('IMAGE_UPLOAD_FORMAT', 'JPEG')  # JPEG / WEBP
+IMAGE_UPLOAD_QUALITY = int(os.getenv('IMAGE_UPLOAD_QUALITY', '85'))
+
+# 分析結果キャッシュ設定（知覚ハッシュで同一・類似画像を判定）
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '500'))
+ANALYSIS_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+ANALYSIS_CACHE_MAX_DISTANCE = int(os.getenv('ANALYSIS_CACHE_MAX_DISTANCE', '5'))  # 64bit中の許容ハミング距離
+ANALYSIS_CACHE_DB = os.getenv('ANALYSIS_CACHE_DB', 'data/analysis_cache.db')  # 空文字でメモリのみ
+
+# Sheets書き込みバッファ設定（ローカルジャーナル経由でまとめて書き込む）
+SHEETS_JOURNAL_DB = os.getenv('SHEETS_JOURNAL_DB', 'data/sheets_journal.db')
+SHEETS_FLUSH_BATCH_SIZE = 20  # この件数たまったら即時書き込み
+SHEETS_FLUSH_INTERVAL = 5  # seconds
+SHEETS_RETRY_MAX_DELAY = 300  # seconds
+SHEETS_MAX_WRITE_ATTEMPTS = 3  # 恒久的なエラーで失敗した行を諦めるまでの試行回数
+
+# 食事記録のローカルレプリカ（レポート用の読み取り専用コピー）
+MEAL_REPLICA_DB = os.getenv('MEAL_REPLICA_DB', 'data/meal_records.db')
+REPLICA_TAIL_WINDOW = 20  # 差分同期時に変更検知する末尾の行数
+REPLICA_MAX_STALENESS = 60  # seconds（これより古ければレポート前に差分同期）
+
+# Sheets API呼び出し設定（専用スレッドプールで実行）
+SHEETS_MAX_WORKERS = 4
+SHEETS_CALL_TIMEOUT = 30  # seconds
+
+# イベントループ遅延監視
+LOOP_LAG_CHECK_INTERVAL = 1.0  # seconds
+LOOP_LAG_WARN_THRESHOLD = float(os.getenv('LOOP_LAG_WARN_THRESHOLD', '0.25'))  # seconds
+LOOP_DEBUG = os.getenv('LOOP_DEBUG', 'false').lower() == 'true'
+
+# 画像分析キュー設定
+MEAL_WORKER_COUNT = int(os.getenv('MEAL_WORKER_COUNT', '3'))  # 同時に分析するジョブ数
+MEAL_QUEUE_MAX_SIZE = int(os.getenv('MEAL_QUEUE_MAX_SIZE', '100'))
+
+# Discordへの送信のレート制御（ルートごとのトークンバケット、Discordのレート制限対策）
+DISCORD_ROUTE_RATE = float(os.getenv('DISCORD_ROUTE_RATE', '1.0'))  # 1ルート（チャンネルごとの送信・編集）の毎秒の送信数
+DISCORD_ROUTE_BURST = int(os.getenv('DISCORD_ROUTE_BURST', '5'))  # 1ルートで間隔を空けずに送れる数
+DISCORD_GLOBAL_RATE = float(os.getenv('DISCORD_GLOBAL_RATE', '40'))  # Bot全体の毎秒の送信数（上限50に余裕を持たせる）
+DISCORD_MAX_RETRIES = 2  # 429を受けた送信を再試行する回数
+
+# ログ設定
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text / json
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '14'))  # 保持するローテーション済みファイル数
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 1ファイルの上限（0で無制限）
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))  # DEBUGログを残す割合
+
+# メトリクス（Prometheus形式で公開、ポート0で無効）
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_DAILY_RETENTION = 7  # 日別カウンターの保持日数
+
+# レポートのメモ化（ユーザー・期間・データバージョンごとの保持件数）
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '256'))
+
 # レポートスケジュール設定
 WEEKLY_REPORT_SCHEDULE = {
     'day_of_week': 6,  # 0=Monday, 6=Sunday
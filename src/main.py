@@ -1,28 +1,49 @@
 # Python 3.13対応
 import src
 
+import random
+import time
+# 起動時間の計測（インポート開始からon_readyまで）
+IMPORT_STARTED = time.perf_counter()
+
 import discord
 from discord.ext import commands
-from src.config.config import DISCORD_BOT_TOKEN, MEAL_CHANNEL_ID
-from src.utils.logger import setup_logger
-from src.services.gemini_service import GeminiService
-from src.services.sheets_service import SheetsService
+from src.config.config import DISCORD_BOT_TOKEN, MEAL_CHANNEL_ID, COMBINE_MULTI_IMAGE_MEALS, MEAL_MAX_DEFERRALS, MEAL_WORKER_COUNT
+from src.utils.logger import setup_logger, stop_logging
+from src.services.container import ServiceContainer
+from src.services.meal_queue import MealJob, MealQueue
+from src.services.meal_record import MealRecord, to_number
 from src.scheduler import ReportScheduler
+from src.utils.loop_monitor import LoopLagMonitor
+from src.utils.discord_outbox import outbox
+from src.utils.message_editor import ThrottledEditor
+from src.utils.metrics import MetricsServer, metrics
+from src.utils.resilience import CircuitOpenError
 
 # ロガーの設定
 logger = setup_logger()
 
-# サービスの初期化
-gemini_service = GeminiService()
-sheets_service = SheetsService()
+# サービスの初期化（各サービスは初回参照時に作成し、接続はon_ready後に行う）
+services = ServiceContainer()
+loop_monitor = LoopLagMonitor()
+metrics_server = MetricsServer()
 
 # Intentsの設定
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 
+class MealBot(commands.Bot):
+    async def close(self):
+        """Bot終了時の処理（共有リソースを解放）"""
+        loop_monitor.stop()
+        await metrics_server.stop()
+        await meal_queue.stop()
+        await services.close()
+        await super().close()
+
 # Botの初期化
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = MealBot(command_prefix='!', intents=intents)
 
 # スケジューラーの初期化（Bot初期化後）
 report_scheduler = None
@@ -34,10 +55,188 @@ async def on_ready():
     logger.info(f'{bot.user} として起動しました')
     logger.info(f'サーバー数: {len(bot.guilds)}')
     
-    # レポートスケジューラー開始
-    report_scheduler = ReportScheduler(bot)
-    report_scheduler.start()
+    # レポートスケジューラー開始（再接続時は起動済み）
+    if report_scheduler is None:
+        report_scheduler = ReportScheduler(bot, services.sheets, services.report)
+        report_scheduler.start()
+        logger.info(f"起動完了: インポートから{time.perf_counter() - IMPORT_STARTED:.2f}s")
     
+    # 画像分析ワーカーとSheets書き込みを開始（再接続時は起動済み）
+    meal_queue.start()
+    services.sheets.start_writer()
+    loop_monitor.start()
+    await metrics_server.start()
+    
+    # Gemini SDKの読み込みとGoogle Sheetsへの接続・レプリカ同期をバックグラウンドで実行
+    services.start()
+
+def build_meal_embed(result: dict, title: str = "食事分析完了") -> discord.Embed:
+    """分析結果のEmbedを作成"""
+    embed = discord.Embed(
+        title=title,
+        description=result.get("meal_description", ""),
+        color=discord.Color.green()
+    )
+    embed.add_field(
+        name="推定カロリー",
+        value=f"{result.get('estimated_calories', 0)} kcal",
+        inline=True
+    )
+
+    nutrients = result.get("nutrients", {})
+    embed.add_field(
+        name="栄養素",
+        value=f"炭水化物: {nutrients.get('carbohydrates', 0)}g\n"
+              f"タンパク質: {nutrients.get('protein', 0)}g\n"
+              f"脂質: {nutrients.get('fat', 0)}g",
+        inline=True
+    )
+
+    if result.get("health_notes"):
+        embed.add_field(
+            name="健康アドバイス",
+            value=result.get("health_notes"),
+            inline=False
+        )
+    return embed
+
+def build_meals_embed(results: list, title: str = "食事分析完了") -> discord.Embed:
+    """複数画像の分析結果を1つのEmbedにまとめる（画像ごとに1フィールド）"""
+    embed = discord.Embed(title=f"{title}（{len(results)}枚）", color=discord.Color.green())
+    for n, result in enumerate(results, 1):
+        nutrients = result.get("nutrients", {})
+        embed.add_field(
+            name=f"画像{n}: {result.get('meal_description', '')}"[:256],
+            value=f"{result.get('estimated_calories', 0)} kcal / "
+                  f"炭水化物 {nutrients.get('carbohydrates', 0)}g・"
+                  f"タンパク質 {nutrients.get('protein', 0)}g・"
+                  f"脂質 {nutrients.get('fat', 0)}g",
+            inline=False
+        )
+    total = sum(to_number(result.get("estimated_calories", 0)) for result in results)
+    embed.add_field(name="合計", value=f"{total:.0f} kcal", inline=False)
+    return embed
+
+def build_progress_embed(partial: dict) -> discord.Embed:
+    """ストリーミング途中の分析結果のEmbedを作成（確定済みの項目のみ）"""
+    embed = discord.Embed(
+        title="食事分析中...",
+        description=partial.get("meal_description", ""),
+        color=discord.Color.light_grey()
+    )
+    if "estimated_calories" in partial:
+        embed.add_field(
+            name="推定カロリー",
+            value=f"{partial['estimated_calories']:.0f} kcal",
+            inline=True
+        )
+    return embed
+
+async def process_meal_job(job: MealJob):
+    """
+    キューから取り出した投稿の画像を分析して記録（ワーカーから呼び出し）
+
+    Discordへの返信は受付時の待ち案内（待ちがある場合のみ）を含めて1通にまとめ、
+    途中経過と結果はその編集で表示する。待ち案内がなければ入力中の表示だけを出し、
+    途中経過または結果の表示で初めて送信する。
+    """
+    message = job.message
+    image_urls = [attachment.url for attachment in job.attachments]
+    user_id = str(message.author.id)
+    metrics.observe("stage_seconds", job.wait_time, stage="queue_wait")
+    editor = ThrottledEditor(job.status_message, channel=message.channel)
+    if job.status_message is None:
+        outbox.typing(message.channel)
+    first_content_at = None
+
+    def show_progress(partial: dict):
+        """分析途中の説明・カロリーを表示（編集は間引いてバックグラウンドで実行）"""
+        nonlocal first_content_at
+        if first_content_at is None:
+            first_content_at = time.monotonic()
+            metrics.observe("stage_seconds", first_content_at - job.enqueued_at, stage="first_content")
+        editor.update(content=f"{message.author.mention} 画像を分析中です...", embed=build_progress_embed(partial))
+
+    try:
+        # Geminiで画像分析（複数枚は一括分析、1枚ならストリーミングで途中経過を表示）
+        with metrics.timer("stage_seconds", stage="analyze"):
+            analyses = await services.gemini.analyze_meal_images(image_urls, on_progress=show_progress)
+
+        recorded = []
+        notes = []
+        saved = 0
+        failed = 0
+        successes = [(url, result) for url, (success, result) in zip(image_urls, analyses)
+                     if success and result and "error" not in result]
+
+        for n, (success, result) in enumerate(analyses, 1):
+            label = f"画像{n}: " if len(image_urls) > 1 else ""
+            if not success or not result:
+                notes.append(f"{label}画像の分析に失敗しました。もう一度お試しください。")
+                failed += 1
+            elif "error" in result:
+                notes.append(f"{label}{result['error']}")
+                failed += 1
+
+        if COMBINE_MULTI_IMAGE_MEALS and len(successes) > 1:
+            # 複数画像を1食分として合算し1行で記録
+            records = [(" ".join(url for url, _ in successes),
+                        services.gemini.combine_results([result for _, result in successes]))]
+            title = f"食事分析完了（{len(successes)}枚の合計）"
+        else:
+            records = successes
+            title = "食事分析完了"
+
+        for url, result in records:
+            # スプレッドシートに記録
+            if await services.sheets.add_meal_record(MealRecord.from_analysis(user_id, result, url)):
+                saved += 1
+                recorded.append(result)
+            else:
+                notes.append("記録の保存に失敗しました。")
+
+        if records and saved == len(records) and not failed:
+            result, mark = "ok", "✅"
+        elif not records:
+            result, mark = "failed", "❌"
+        else:
+            result, mark = "partial", "⚠️"
+        # 結果の印はリアクションを付けずに本文の先頭に入れる
+        if len(recorded) > 1:
+            embeds = [build_meals_embed(recorded, title)]
+        else:
+            embeds = [build_meal_embed(r, title) for r in recorded]
+        with metrics.timer("stage_seconds", stage="discord_edit"):
+            await editor.finish(content="\n".join([f"{mark} {message.author.mention}"] + notes), embeds=embeds)
+        if first_content_at is None:
+            # 途中経過を表示しなかった場合は最終結果が最初の表示
+            metrics.observe("stage_seconds", time.monotonic() - job.enqueued_at, stage="first_content")
+
+        metrics.inc("meal_posts_total", result=result)
+        # 投稿の受付から返信までの全体時間
+        metrics.observe("stage_seconds", time.monotonic() - job.enqueued_at, stage="total")
+
+    except CircuitOpenError as e:
+        # Geminiの障害中は失敗させずに復旧を待ってから分析し直す
+        if job.deferrals >= MEAL_MAX_DEFERRALS:
+            metrics.inc("meal_posts_total", result="error")
+            logger.error(f"分析を{job.deferrals}回後回しにしても復旧しないため中止: {e}")
+            await editor.finish(content=f"❌ {message.author.mention} 分析サービスが復旧しないため分析できませんでした。時間をおいて再度投稿してください。", embeds=[])
+            return
+        delay = e.retry_after + random.uniform(0, e.retry_after / 2)
+        meal_queue.defer(job, delay)
+        metrics.inc("meal_posts_total", result="deferred")
+        await editor.finish(content=f"🕒 {message.author.mention} 分析サービスが混み合っているため、約{delay:.0f}秒後に自動で再分析します。", embeds=[])
+        # 再分析の結果も同じメッセージの編集で表示する
+        job.status_message = editor.message
+    except Exception as e:
+        metrics.inc("meal_posts_total", result="error")
+        logger.error(f"画像処理エラー: {e}")
+        await editor.finish(content=f"❌ {message.author.mention} エラーが発生しました。", embeds=[])
+
+# 画像分析キュー
+meal_queue = MealQueue(process_meal_job)
+
 @bot.event
 async def on_message(message):
     """メッセージ受信時の処理"""
@@ -45,81 +244,39 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # 食事写真チャンネルでの処理
+    # 食事写真チャンネルでの処理（キューに積んで受付のみ行う）
     if message.channel.id == MEAL_CHANNEL_ID:
         # 画像が添付されているかチェック
-        if message.attachments:
-            for attachment in message.attachments:
-                if any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp']):
-                    logger.info(f"画像を受信しました: {attachment.filename} from {message.author}")
-                    
-                    # 処理中を示すリアクション
-                    await message.add_reaction('👀')
-                    
-                    try:
-                        # 画像URLを取得
-                        image_url = attachment.url
-                        
-                        # Geminiで画像分析
-                        analysis_msg = await message.channel.send(f"{message.author.mention} 画像を分析中です...")
-                        success, result = await gemini_service.analyze_meal_image(image_url)
-                        
-                        if success and result:
-                            # エラーチェック
-                            if "error" in result:
-                                await analysis_msg.edit(content=f"{message.author.mention} {result['error']}")
-                                await message.add_reaction('❌')
-                                continue
-                            
-                            # スプレッドシートに記録
-                            sheet_success = await sheets_service.add_meal_record(
-                                str(message.author.id),
-                                result,
-                                image_url
-                            )
-                            
-                            if sheet_success:
-                                # 成功メッセージ
-                                embed = discord.Embed(
-                                    title="食事分析完了",
-                                    description=result.get("meal_description", ""),
-                                    color=discord.Color.green()
-                                )
-                                embed.add_field(
-                                    name="推定カロリー",
-                                    value=f"{result.get('estimated_calories', 0)} kcal",
-                                    inline=True
-                                )
-                                
-                                nutrients = result.get("nutrients", {})
-                                embed.add_field(
-                                    name="栄養素",
-                                    value=f"炭水化物: {nutrients.get('carbohydrates', 0)}g\n"
-                                          f"タンパク質: {nutrients.get('protein', 0)}g\n"
-                                          f"脂質: {nutrients.get('fat', 0)}g",
-                                    inline=True
-                                )
-                                
-                                if result.get("health_notes"):
-                                    embed.add_field(
-                                        name="健康アドバイス",
-                                        value=result.get("health_notes"),
-                                        inline=False
-                                    )
-                                
-                                await analysis_msg.edit(content=f"{message.author.mention}", embed=embed)
-                                await message.add_reaction('✅')
-                            else:
-                                await analysis_msg.edit(content=f"{message.author.mention} 記録の保存に失敗しました。")
-                                await message.add_reaction('⚠️')
-                        else:
-                            await analysis_msg.edit(content=f"{message.author.mention} 画像の分析に失敗しました。もう一度お試しください。")
-                            await message.add_reaction('❌')
-                            
-                    except Exception as e:
-                        logger.error(f"画像処理エラー: {e}")
-                        await message.channel.send(f"{message.author.mention} エラーが発生しました。")
-                        await message.add_reaction('❌')
+        image_attachments = [
+            attachment for attachment in message.attachments
+            if any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp'])
+        ]
+        if image_attachments:
+            logger.info(f"画像を受信しました: {', '.join(a.filename for a in image_attachments)} from {message.author}")
+            
+            accepted_at = time.perf_counter()
+            busy = f"❌ {message.author.mention} 混雑しています。しばらくしてから再度投稿してください。"
+            if meal_queue.depth >= meal_queue.max_size:
+                await outbox.send(message.channel, content=busy)
+            else:
+                # 待ちがある場合だけ受付を返信し、結果はその返信の編集で表示する
+                # （すぐに分析を始める場合はワーカーが入力中を表示する）
+                waiting = meal_queue.depth + meal_queue.active
+                status_message = None
+                if waiting >= MEAL_WORKER_COUNT:
+                    status_message = await outbox.send(
+                        message.channel,
+                        content=f"{message.author.mention} 画像を受け付けました。順番に分析します...（待ち: {waiting}件）"
+                    )
+                
+                job = MealJob(str(message.author.id), message, image_attachments, status_message)
+                if not await meal_queue.enqueue(job):
+                    if status_message:
+                        await outbox.edit(status_message, content=busy)
+                    else:
+                        await outbox.send(message.channel, content=busy)
+                else:
+                    metrics.observe("stage_seconds", time.perf_counter() - accepted_at, stage="accept")
     
     # コマンド処理を継続
     await bot.process_commands(message)
@@ -139,8 +296,113 @@ async def status(ctx):
     embed.add_field(name="稼働状況", value="正常", inline=True)
     embed.add_field(name="サーバー数", value=len(bot.guilds), inline=True)
     embed.add_field(name="レイテンシ", value=f"{round(bot.latency * 1000)}ms", inline=True)
+    
+    lag_stats = loop_monitor.get_stats()
+    embed.add_field(
+        name="イベントループ遅延",
+        value=f"直近: {lag_stats['last_lag'] * 1000:.0f}ms / 最大: {lag_stats['max_lag'] * 1000:.0f}ms "
+              f"（警告 {lag_stats['warnings']}回）",
+        inline=False
+    )
+    
+    queue_stats = meal_queue.get_stats()
+    embed.add_field(
+        name="分析キュー",
+        value=f"待ち: {queue_stats['depth']}件 / 処理中: {queue_stats['active']}件\n"
+              f"平均待ち時間: {queue_stats['avg_wait']}s（最大 {queue_stats['max_wait']}s）\n"
+              f"処理済み: {queue_stats['processed']}件 / 失敗: {queue_stats['failed']}件 / "
+              f"再分析待ち: {queue_stats['waiting_retry']}件",
+        inline=False
+    )
+    
+    cache_stats = services.gemini.cache.get_stats()
+    embed.add_field(
+        name="分析キャッシュ",
+        value=f"ヒット: {cache_stats['hits']}件 / ミス: {cache_stats['misses']}件 "
+              f"（ヒット率 {cache_stats['hit_rate'] * 100:.1f}%）\n"
+              f"保持件数: {cache_stats['size']}件",
+        inline=False
+    )
+    
+    if report_scheduler:
+        report_cache_stats = report_scheduler.report_service.cache.get_stats()
+        embed.add_field(
+            name="レポートキャッシュ",
+            value=f"ヒット: {report_cache_stats['hits']}件 / ミス: {report_cache_stats['misses']}件 "
+                  f"（保持 {report_cache_stats['size']}件）",
+            inline=False
+        )
+
+    writer_stats = services.sheets.write_buffer.get_stats()
+    embed.add_field(
+        name="Sheets書き込み",
+        value=f"未送信: {writer_stats['pending']}件 / 書き込み済み: {writer_stats['flushed']}件 / "
+              f"書き込み不能: {writer_stats['dead']}件",
+        inline=False
+    )
+    
+    outbox_stats = outbox.get_stats()
+    embed.add_field(
+        name="Discord送信",
+        value=f"送信: {outbox_stats['sent']}件 / 編集: {outbox_stats['edited']}件"
+              f"（統合 {outbox_stats['coalesced']}件） / 429: {outbox_stats['rate_limited']}回",
+        inline=False
+    )
+    
+    breakers = [services.gemini.breaker.get_stats(), services.sheets.breaker.get_stats()]
+    embed.add_field(
+        name="外部API",
+        value="\n".join(
+            f"{name}: {stats['state']}" + (f"（再開まで {stats['retry_after']}s）" if stats['retry_after'] else "")
+            for name, stats in zip(("Gemini", "Sheets"), breakers)
+        ),
+        inline=False
+    )
+    
+    api_stats = services.sheets.get_api_stats()
+    embed.add_field(
+        name="Sheets API呼び出し",
+        value="\n".join(f"{op}: {count}回" for op, count in sorted(api_stats.items())) or "なし",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
+@bot.command(name='metrics')
+@commands.has_permissions(administrator=True)
+async def show_metrics(ctx):
+    """処理段階ごとの所要時間とカウンターを表示（管理者用）"""
+    embed = discord.Embed(title="メトリクス", color=discord.Color.blue())
+    
+    stage_lines = [
+        f"{labels['stage']}: {count}件 p50 {p50:.2f}s / p95 {p95:.2f}s"
+        for labels, count, _, p50, p95 in metrics.histogram_summary("stage_seconds")
+    ]
+    embed.add_field(name="処理時間", value="\n".join(stage_lines) or "データなし", inline=False)
+    
+    sheets_lines = [
+        f"{labels['op']}: {count}件 p50 {p50:.2f}s / p95 {p95:.2f}s"
+        for labels, count, _, p50, p95 in metrics.histogram_summary("sheets_call_seconds")
+    ]
+    embed.add_field(name="Sheets API", value="\n".join(sheets_lines) or "データなし", inline=False)
+    
+    embed.add_field(
+        name="Gemini",
+        value=f"本日のリクエスト: {metrics.daily_value('gemini_requests_daily')}回\n"
+              f"リトライ: {metrics.counter_total('gemini_retries_total'):.0f}回 / "
+              f"分析失敗: {metrics.counter_total('analysis_failures_total'):.0f}件\n"
+              f"キャッシュヒット: {metrics.counter_value('analysis_cache_total', result='hit') + metrics.counter_value('analysis_cache_total', result='near_hit'):.0f}件 / "
+              f"ミス: {metrics.counter_value('analysis_cache_total', result='miss'):.0f}件",
+        inline=False
+    )
     await ctx.send(embed=embed)
 
+@show_metrics.error
+async def show_metrics_error(ctx, error):
+    if isinstance(error, commands.CheckFailure):
+        await ctx.send("⚠️ このコマンドは管理者のみ実行できます。")
+    else:
+        logger.error(f"メトリクス表示エラー: {error}")
+
 @bot.command(name='weekly')
 async def force_weekly_report(ctx):
     """手動で週次レポートを生成"""
@@ -157,6 +419,29 @@ async def force_monthly_report(ctx):
     else:
         await ctx.send("⚠️ スケジューラーが初期化されていません。")
 
+@bot.command(name='resync')
+@commands.has_permissions(administrator=True)
+@commands.cooldown(1, 300, commands.BucketType.default)
+async def resync(ctx):
+    """食事記録レプリカをシートから再構築（管理者用、シート全体を読み込むため5分に1回まで）"""
+    await ctx.send("食事記録をスプレッドシートから再同期中...")
+    try:
+        await services.sheets.sync_replica(full=True)
+        count = await services.sheets.get_replica_size()
+        await ctx.send(f"✅ 再同期が完了しました（{count}件）")
+    except Exception as e:
+        logger.error(f"再同期エラー: {e}")
+        await ctx.send("⚠️ 再同期中にエラーが発生しました。")
+
+@resync.error
+async def resync_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        await ctx.send(f"⚠️ 再同期は{error.retry_after:.0f}秒後に実行できます。")
+    elif isinstance(error, commands.CheckFailure):
+        await ctx.send("⚠️ このコマンドは管理者のみ実行できます。")
+    else:
+        logger.error(f"再同期エラー: {error}")
+
 def main():
     """メイン関数"""
     try:
@@ -167,6 +452,7 @@ def main():
         # スケジューラー停止
         if report_scheduler:
             report_scheduler.stop()
+        stop_logging()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,9 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import time
 import discord
 from src.config.config import (
     WEEKLY_REPORT_SCHEDULE,
@@ -9,19 +12,20 @@ from src.config.config import (
     MONTHLY_REPORT_CHANNEL_ID,
     TIMEZONE
 )
-from src.services.sheets_service import SheetsService
-from src.services.report_service import ReportService
+from src.services.report_service import ReportService, group_rollups_by_user
+from src.utils.discord_outbox import outbox
 from src.utils.logger import setup_logger
-import calendar
+from src.utils.periods import Period, month_period, week_period
 
 logger = setup_logger()
 
 class ReportScheduler:
-    def __init__(self, bot):
+    def __init__(self, bot, sheets_service, report_service: ReportService):
         self.bot = bot
         self.scheduler = AsyncIOScheduler(timezone=TIMEZONE)
-        self.sheets_service = SheetsService()
-        self.report_service = ReportService()
+        # Bot本体と同じインスタンスを共有する
+        self.sheets_service = sheets_service
+        self.report_service = report_service
         self.setup_jobs()
     
     def setup_jobs(self):
@@ -63,10 +67,66 @@ class ReportScheduler:
         self.scheduler.shutdown()
         logger.info("レポートスケジューラーを停止しました")
     
+    async def _resolve_user_name(self, user_id: str) -> str:
+        """ユーザーIDから表示名を取得（キャッシュにない場合はAPIで取得）"""
+        try:
+            user = self.bot.get_user(int(user_id)) or await self.bot.fetch_user(int(user_id))
+        except (ValueError, discord.HTTPException):
+            user = None
+        return user.display_name if user else "ユーザー"
+    
+    async def _build_weekly_embed(self, user_id: str, week_rollups: List[Dict], period: Period,
+                                  previous_rollups: Optional[List[Dict]], version: Tuple) -> discord.Embed:
+        user_name = await self._resolve_user_name(user_id)
+        _, embed = self.report_service.weekly_report(
+            user_id,
+            user_name,
+            week_rollups,
+            period.first_day,
+            period.last_day,
+            previous_rollups,
+            version=version
+        )
+        return embed
+    
+    async def _build_monthly_embed(self, user_id: str, month_rollups: List[Dict], period: Period,
+                                   version: Tuple) -> discord.Embed:
+        user_name = await self._resolve_user_name(user_id)
+        _, embed = self.report_service.monthly_report(
+            user_id,
+            user_name,
+            month_rollups,
+            period.first_day.year,
+            period.first_day.month,
+            version=version
+        )
+        return embed
+    
+    async def _send_reports(self, channel, user_ids: List[str], results: List) -> int:
+        """
+        ユーザーごとのレポートを送信（送信間隔はoutboxがチャンネルの送信枠に合わせて空ける）
+        
+        Returns:
+            送信できたレポート数
+        """
+        sent = 0
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"レポート作成エラー: user={user_id} {result}")
+                continue
+            try:
+                await outbox.send(channel, embed=result)
+                sent += 1
+            except discord.HTTPException as e:
+                logger.error(f"レポート送信エラー: user={user_id} {e}")
+        return sent
+    
     async def generate_weekly_report(self):
-        """週次レポートを生成"""
+        """週次レポートを生成（期間内に記録のある全ユーザー分）"""
+        channel = None
         try:
             logger.info("週次レポート生成開始")
+            started = time.monotonic()
             
             # レポートチャンネルを取得
             channel = self.bot.get_channel(WEEKLY_REPORT_CHANNEL_ID)
@@ -75,53 +135,59 @@ class ReportScheduler:
                 return
             
             # 期間計算（先週の月曜日から日曜日）
-            today = datetime.now(TIMEZONE)
-            start_date = today - timedelta(days=today.weekday() + 7)
-            end_date = start_date + timedelta(days=6)
-            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+            period = week_period(weeks_ago=1)
             
-            # データ取得（ハードコーディングされたユーザーID）
-            # TODO: 将来的には複数ユーザー対応
-            user_id = "878488075196584018"  # あなたのDiscordユーザーID
-            week_data = await self.sheets_service.get_weekly_data(
-                user_id,
-                start_date,
-                end_date
+            # 全ユーザー分の日次集計を1回で取得してユーザーごとに分ける
+            # （前週比を含むため前週の開始日からのデータバージョンも同時に取得）
+            week_rollups, versions = await self.sheets_service.get_daily_rollups_with_versions(
+                period, period.previous().extend_to(period)
             )
+            week_by_user = group_rollups_by_user(week_rollups)
             
-            if not week_data:
-                await channel.send(
-                    "📊 **週次レポート**\n"
-                    f"期間: {start_date.strftime('%Y/%m/%d')} - {end_date.strftime('%Y/%m/%d')}\n"
+            if not week_by_user:
+                await outbox.send(
+                    channel,
+                    content="📊 **週次レポート**\n"
+                    f"期間: {period.first_day.strftime('%Y/%m/%d')} - {period.last_day.strftime('%Y/%m/%d')}\n"
                     "今週は記録がありませんでした。来週は食事記録を頑張りましょう！"
                 )
                 return
             
-            # レポート生成
-            # ユーザー名取得
-            user = self.bot.get_user(int(user_id))
-            user_name = user.display_name if user else "ユーザー"
-            
-            embed = self.report_service.create_weekly_report_embed(
-                user_name,
-                week_data,
-                start_date,
-                end_date
+            # 前週比のために前週分も取得
+            previous_by_user = group_rollups_by_user(
+                await self.sheets_service.get_daily_rollups(None, period.previous())
             )
             
-            await channel.send(embed=embed)
-            logger.info("週次レポート送信完了")
+            # ユーザーごとのレポートを並行して作成
+            user_ids = list(week_by_user)
+            results = await asyncio.gather(*(
+                self._build_weekly_embed(
+                    user_id,
+                    week_by_user[user_id],
+                    period,
+                    previous_by_user.get(user_id),
+                    versions[user_id]
+                )
+                for user_id in user_ids
+            ), return_exceptions=True)
+            
+            sent = await self._send_reports(channel, user_ids, results)
+            logger.info(
+                f"週次レポート送信完了: {sent}/{len(user_ids)}人 "
+                f"所要時間 {time.monotonic() - started:.2f}s"
+            )
             
         except Exception as e:
             logger.error(f"週次レポート生成エラー: {e}")
             if channel:
-                await channel.send("⚠️ 週次レポート生成中にエラーが発生しました。")
+                await outbox.send(channel, content="⚠️ 週次レポート生成中にエラーが発生しました。")
     
     async def generate_monthly_report(self):
-        """月次レポートを生成"""
+        """月次レポートを生成（期間内に記録のある全ユーザー分）"""
+        channel = None
         try:
             logger.info("月次レポート生成開始")
+            started = time.monotonic()
             
             # レポートチャンネルを取得
             channel = self.bot.get_channel(MONTHLY_REPORT_CHANNEL_ID)
@@ -133,41 +199,38 @@ class ReportScheduler:
             today = datetime.now(TIMEZONE)
             year = today.year
             month = today.month
+            period = month_period(year, month)
             
-            # データ取得
-            user_id = "878488075196584018"  # あなたのDiscordユーザーID
-            month_data = await self.sheets_service.get_monthly_data(
-                user_id,
-                year,
-                month
-            )
+            # 全ユーザー分の日次集計とデータバージョンを1回で取得してユーザーごとに分ける
+            month_rollups, versions = await self.sheets_service.get_daily_rollups_with_versions(period)
+            month_by_user = group_rollups_by_user(month_rollups)
             
-            if not month_data:
-                await channel.send(
-                    "📊 **月次レポート**\n"
+            if not month_by_user:
+                await outbox.send(
+                    channel,
+                    content="📊 **月次レポート**\n"
                     f"{year}年{month}月\n"
                     "今月は記録がありませんでした。来月は食事記録を頑張りましょう！"
                 )
                 return
             
-            # レポート生成
-            user = self.bot.get_user(int(user_id))
-            user_name = user.display_name if user else "ユーザー"
-            
-            embed = self.report_service.create_monthly_report_embed(
-                user_name,
-                month_data,
-                year,
-                month
+            # ユーザーごとのレポートを並行して作成
+            user_ids = list(month_by_user)
+            results = await asyncio.gather(*(
+                self._build_monthly_embed(user_id, month_by_user[user_id], period, versions[user_id])
+                for user_id in user_ids
+            ), return_exceptions=True)
+            
+            sent = await self._send_reports(channel, user_ids, results)
+            logger.info(
+                f"月次レポート送信完了: {sent}/{len(user_ids)}人 "
+                f"所要時間 {time.monotonic() - started:.2f}s"
             )
             
-            await channel.send(embed=embed)
-            logger.info("月次レポート送信完了")
-            
         except Exception as e:
             logger.error(f"月次レポート生成エラー: {e}")
             if channel:
-                await channel.send("⚠️ 月次レポート生成中にエラーが発生しました。")
+                await outbox.send(channel, content="⚠️ 月次レポート生成中にエラーが発生しました。")
     
     async def force_weekly_report(self, ctx):
         """手動で週次レポートを生成（コマンド用）"""
@@ -0,0 +1,195 @@
+import copy
+import io
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image
+from src.config.config import (
+    ANALYSIS_CACHE_SIZE,
+    ANALYSIS_CACHE_TTL,
+    ANALYSIS_CACHE_MAX_DISTANCE,
+    ANALYSIS_CACHE_DB
+)
+from src.utils.logger import setup_logger
+from src.utils.metrics import metrics
+
+logger = setup_logger()
+
+HASH_SIZE = 8  # 8x8 = 64bitのハッシュ
+
+
+def compute_dhash(image_data: bytes, hash_size: int = HASH_SIZE) -> int:
+    """
+    画像の差分ハッシュ（dHash）を計算
+
+    縮小したグレースケール画像で隣接ピクセルの明暗を比較するため、
+    再圧縮やリサイズ程度の違いでは値がほとんど変わらない。
+    """
+    image = Image.open(io.BytesIO(image_data))
+    # JPEGはデコード時点で縮小して高速化
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    image = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+
+    value = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * width + col]
+            right = pixels[row * width + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュのハミング距離"""
+    return (a ^ b).bit_count()
+
+
+class AnalysisCache:
+    """
+    画像の知覚ハッシュをキーにした分析結果キャッシュ
+
+    メモリ上のLRUに加えて、db_pathを指定するとSQLiteにも保存し、
+    再起動後もキャッシュを引き継ぐ。
+    """
+
+    def __init__(self, max_size: int = ANALYSIS_CACHE_SIZE, ttl: float = ANALYSIS_CACHE_TTL,
+                 max_distance: int = ANALYSIS_CACHE_MAX_DISTANCE,
+                 db_path: Optional[str] = ANALYSIS_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "near_hits": 0, "evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        """SQLiteを開いて有効期限内のエントリをメモリに読み込む"""
+        try:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+            self._db = sqlite3.connect(db_path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "hash TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM analysis_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+            rows = self._db.execute(
+                "SELECT hash, result, created_at FROM analysis_cache ORDER BY created_at DESC LIMIT ?",
+                (self.max_size,)
+            ).fetchall()
+            for hash_hex, result, created_at in reversed(rows):
+                self._entries[int(hash_hex, 16)] = (created_at, json.loads(result))
+            logger.info(f"分析キャッシュを読み込みました: {len(rows)}件")
+        except Exception as e:
+            logger.error(f"分析キャッシュDB初期化エラー: {e}")
+            self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def get(self, image_hash: int) -> Optional[Dict]:
+        """
+        ハッシュが一致または近い画像の分析結果を取得
+
+        Returns:
+            キャッシュされた分析結果のコピー、該当なしの場合None
+        """
+        # 期限切れのエントリは候補にせず、見つけたものは削除する
+        expired = set()
+        key = None
+        entry = self._entries.get(image_hash)
+        if entry is not None:
+            if self._is_expired(entry[0]):
+                expired.add(image_hash)
+            else:
+                key = image_hash
+
+        if key is None and self.max_distance > 0:
+            # 近似一致（ハミング距離が閾値以内で最も近い有効なもの）
+            best_distance = self.max_distance + 1
+            for candidate, (created_at, _) in self._entries.items():
+                distance = hamming_distance(image_hash, candidate)
+                if distance >= best_distance:
+                    continue
+                if self._is_expired(created_at):
+                    expired.add(candidate)
+                else:
+                    key, best_distance = candidate, distance
+
+        for expired_key in expired:
+            self._remove(expired_key)
+
+        if key is not None:
+            _, result = self._entries[key]
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            if key != image_hash:
+                self.stats["near_hits"] += 1
+            metrics.inc("analysis_cache_total", result="near_hit" if key != image_hash else "hit")
+            return copy.deepcopy(result)
+
+        self.stats["misses"] += 1
+        metrics.inc("analysis_cache_total", result="miss")
+        return None
+
+    def put(self, image_hash: int, result: Dict):
+        """分析結果を保存"""
+        created_at = time.time()
+        self._entries[image_hash] = (created_at, copy.deepcopy(result))
+        self._entries.move_to_end(image_hash)
+
+        while len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+            self._delete_from_db(old_key)
+
+        if self._db:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (hash, result, created_at) VALUES (?, ?, ?)",
+                    (f"{image_hash:016x}", json.dumps(result, ensure_ascii=False), created_at)
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.error(f"分析キャッシュ保存エラー: {e}")
+
+    def _remove(self, key: int):
+        self._entries.pop(key, None)
+        self._delete_from_db(key)
+
+    def _delete_from_db(self, key: int):
+        if self._db:
+            try:
+                self._db.execute("DELETE FROM analysis_cache WHERE hash = ?", (f"{key:016x}",))
+                self._db.commit()
+            except Exception as e:
+                logger.error(f"分析キャッシュ削除エラー: {e}")
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
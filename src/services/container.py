@@ -0,0 +1,99 @@
+import asyncio
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class ServiceContainer:
+    """
+    ボット全体で共有するサービスのコンテナ
+
+    各サービスは最初に参照されたときに1つだけ作成する。
+    重いライブラリの読み込みやGoogleへの接続はstart()で
+    バックグラウンドに回し、Discordへの接続を待たせない。
+    """
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._startup: Optional[asyncio.Task] = None
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    started = time.monotonic()
+                    instance = factory()
+                    self._instances[name] = instance
+                    logger.info(f"サービスを作成しました: {name} ({time.monotonic() - started:.2f}s)")
+        return instance
+
+    @property
+    def gemini(self):
+        def create():
+            from src.services.gemini_service import GeminiService
+            return GeminiService()
+        return self._get("gemini", create)
+
+    @property
+    def sheets(self):
+        def create():
+            from src.services.sheets_service import SheetsService
+            return SheetsService()
+        return self._get("sheets", create)
+
+    @property
+    def report(self):
+        def create():
+            from src.services.report_service import ReportService
+            return ReportService()
+        return self._get("report", create)
+
+    def start(self):
+        """バックグラウンドで事前読み込みと接続を開始（イベントループ上で1回だけ実行される）"""
+        if self._startup is None:
+            self._startup = asyncio.create_task(self._warm_up(), name="service-startup")
+
+    async def _warm_up(self):
+        started = time.monotonic()
+        results = await asyncio.gather(
+            self._warm_up_gemini(),
+            self._warm_up_sheets(),
+            return_exceptions=True
+        )
+        for name, result in zip(("gemini", "sheets"), results):
+            if isinstance(result, Exception):
+                # 失敗しても最初の利用時に再試行される
+                logger.error(f"サービスの事前準備エラー ({name}): {result}")
+        logger.info(f"サービスの事前準備が完了しました: {time.monotonic() - started:.2f}s")
+
+    async def _warm_up_gemini(self):
+        # SDKの読み込みが重いためモジュールの読み込みだけスレッドで行い、
+        # インスタンス（SQLite接続を持つ）はイベントループのスレッドで作る
+        await asyncio.to_thread(importlib.import_module, "src.services.gemini_service")
+        return self.gemini
+
+    async def _warm_up_sheets(self):
+        sheets = self.sheets
+        await sheets.connect()
+        # レポート用レプリカを同期（失敗してもレポート参照時に再試行される）
+        await sheets.sync_replica()
+
+    async def close(self):
+        """作成済みのサービスを終了"""
+        if self._startup and not self._startup.done():
+            self._startup.cancel()
+            await asyncio.gather(self._startup, return_exceptions=True)
+        for name in ("gemini", "sheets"):
+            instance = self._instances.get(name)
+            if instance is not None:
+                try:
+                    await instance.close()
+                except Exception as e:
+                    logger.error(f"サービス終了エラー ({name}): {e}")
@@ -1,19 +1,155 @@
 import google.generativeai as genai
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import asyncio
+import re
+import time
 import aiohttp
-from src.config.config import GEMINI_API_KEY, GEMINI_MODEL, MAX_RETRY_ATTEMPTS
+from src.config.config import (
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    MAX_RETRY_ATTEMPTS,
+    GEMINI_RETRY_MAX_DELAY,
+    IMAGE_ANALYSIS_TIMEOUT,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_BATCH_SIZE,
+    GEMINI_STREAMING,
+    GEMINI_STRUCTURED_OUTPUT,
+    IMAGE_DOWNLOAD_CONNECT_TIMEOUT,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL
+)
+from src.services.analysis_cache import AnalysisCache, compute_dhash
+from src.utils.image_utils import preprocess_image
+from src.utils.json_utils import coerce_number, extract_json
 from src.utils.logger import setup_logger
+from src.utils.metrics import metrics
+from src.utils.resilience import CircuitBreaker, CircuitOpenError, decorrelated_jitter, error_status, is_transient_error
 import json
 
 logger = setup_logger()
 
-# Gemini APIの設定
-genai.configure(api_key=GEMINI_API_KEY)
+MEAL_CATEGORIES = ["朝食", "昼食", "夕食", "間食", "その他"]
+NUTRIENT_KEYS = ["carbohydrates", "protein", "fat", "fiber", "sodium"]
+
+# 構造化出力で使う1枚分の応答スキーマ（食事でない場合はerrorだけを返す）
+MEAL_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "meal_description": {"type": "string"},
+        "estimated_calories": {"type": "number"},
+        "nutrients": {
+            "type": "object",
+            "properties": {key: {"type": "number"} for key in NUTRIENT_KEYS},
+            "required": NUTRIENT_KEYS
+        },
+        "meal_category": {"type": "string", "enum": MEAL_CATEGORIES},
+        "health_notes": {"type": "string"},
+        "error": {"type": "string"}
+    }
+}
+BATCH_RESPONSE_SCHEMA = {"type": "array", "items": MEAL_RESPONSE_SCHEMA}
+
+
+def _round_number(value: Optional[float]):
+    """整数値はintに、それ以外は小数第1位に丸める（欠損は0）"""
+    if value is None:
+        return 0
+    value = round(value, 1)
+    return int(value) if value.is_integer() else value
+
+
+def validate_meal_result(result) -> Optional[Dict]:
+    """
+    分析結果の形式を検証し、数値項目を数値に揃える
+
+    "約500" のような文字列の数値は変換し、栄養素の欠損は0とする。
+    食事でない場合は {"error": ...} を返す。
+
+    Returns:
+        検証済みの分析結果、必須項目が欠けている場合None
+    """
+    if not isinstance(result, dict):
+        return None
+    if result.get("error"):
+        return {"error": str(result["error"])}
+    
+    description = result.get("meal_description")
+    calories = coerce_number(result.get("estimated_calories"))
+    nutrients = result.get("nutrients")
+    if not description or calories is None or not isinstance(nutrients, dict):
+        return None
+    
+    category = result.get("meal_category")
+    return {
+        "meal_description": str(description),
+        "estimated_calories": round(calories),
+        "nutrients": {key: _round_number(coerce_number(nutrients.get(key))) for key in NUTRIENT_KEYS},
+        "meal_category": category if category in MEAL_CATEGORIES else "その他",
+        "health_notes": str(result.get("health_notes") or "")
+    }
+
+# ストリーミング中の未完成のJSONから取り出す項目（値が確定したものだけ）
+_PARTIAL_DESCRIPTION = re.compile(r'"meal_description"\s*:\s*("(?:[^"\\]|\\.)*")')
+_PARTIAL_CALORIES = re.compile(r'"estimated_calories"\s*:\s*(\d+(?:\.\d+)?)\s*[,}\n]')
+
+
+def extract_partial_fields(text: str) -> Dict:
+    """ストリーミング途中の応答テキストから確定済みの説明とカロリーを取り出す"""
+    fields = {}
+    match = _PARTIAL_DESCRIPTION.search(text)
+    if match:
+        try:
+            fields["meal_description"] = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    match = _PARTIAL_CALORIES.search(text)
+    if match:
+        fields["estimated_calories"] = float(match.group(1))
+    return fields
+
+
+class StreamedResponse:
+    """ストリーミングで受信したテキストをまとめた応答（通常の応答と同じく.textを持つ）"""
+
+    def __init__(self, text: str):
+        self.text = text
+
 
 class GeminiService:
     def __init__(self):
+        # Gemini APIの設定
+        genai.configure(api_key=GEMINI_API_KEY)
         self.model = genai.GenerativeModel(GEMINI_MODEL)
+        # 構造化出力（JSONのMIMEタイプと応答スキーマ）で形式不正の応答を防ぐ
+        self.generation_config: Optional[genai.GenerationConfig] = None
+        self.batch_generation_config: Optional[genai.GenerationConfig] = None
+        self.stream_generation_config: Optional[genai.GenerationConfig] = None
+        if GEMINI_STRUCTURED_OUTPUT:
+            self.generation_config = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=MEAL_RESPONSE_SCHEMA
+            )
+            self.batch_generation_config = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=BATCH_RESPONSE_SCHEMA
+            )
+            # スキーマを指定すると項目がアルファベット順に生成され、途中経過に使う説明が
+            # 最後の方まで届かないため、ストリーミングではMIMEタイプだけを指定して
+            # プロンプトの項目順（説明が先頭）で生成させる
+            self.stream_generation_config = genai.GenerationConfig(
+                response_mime_type="application/json"
+            )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker("Gemini")
+        self.cache = AnalysisCache()
+        self.stats = {
+            "download_count": 0, "download_time": 0.0, "download_bytes": 0,
+            "preprocess_count": 0, "preprocess_time": 0.0, "bytes_saved": 0,
+            "gemini_count": 0, "gemini_time": 0.0, "upload_bytes": 0,
+            "batch_count": 0, "batch_images": 0, "batch_fallbacks": 0
+        }
         self.prompt_template = """
         この画像の食事を分析してください。以下のJSON形式で回答してください：
         
@@ -36,87 +172,463 @@ class GeminiService:
         - 画像が食事でない場合は、{"error": "食事の画像ではありません"}と返してください
         - 必ずJSON形式で返してください
         """
+        self.batch_prompt_template = """
+        これから{count}枚の食事画像を送ります。画像ごとに食事を分析し、
+        画像の順番どおりに{count}個の要素を持つJSON配列で回答してください。
+        各要素は以下のJSON形式です：
+        
+        {{
+            "meal_description": "食事の詳細な説明",
+            "estimated_calories": カロリー推定値（数値のみ）,
+            "nutrients": {{
+                "carbohydrates": 炭水化物のグラム数（数値のみ）,
+                "protein": タンパク質のグラム数（数値のみ）,
+                "fat": 脂質のグラム数（数値のみ）,
+                "fiber": 食物繊維のグラム数（数値のみ）,
+                "sodium": ナトリウムのミリグラム数（数値のみ）
+            }},
+            "meal_category": "朝食/昼食/夕食/間食/その他",
+            "health_notes": "健康面でのアドバイスや注意点"
+        }}
+        
+        注意：
+        - 数値は推定値で構いません
+        - 配列の要素数は必ず画像の枚数（{count}）と同じにしてください
+        - 食事の画像でないものは、その要素を{{"error": "食事の画像ではありません"}}にしてください
+        - 必ずJSON配列の形式で返してください
+        """
     
-    async def analyze_meal_image(self, image_url: str) -> Tuple[bool, Optional[Dict]]:
+    def _get_session(self) -> aiohttp.ClientSession:
+        """画像ダウンロード用の共有セッションを取得（初回に作成）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=IMAGE_ANALYSIS_TIMEOUT,
+                connect=IMAGE_DOWNLOAD_CONNECT_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+    
+    async def close(self):
+        """共有セッションを閉じる（Bot終了時に呼び出し）"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self.cache.close()
+    
+    async def _download_image(self, image_url: str) -> Optional[bytes]:
+        """画像をダウンロード（失敗時はNone）"""
+        start = time.perf_counter()
+        session = self._get_session()
+        async with session.get(image_url) as response:
+            if response.status != 200:
+                logger.error(f"画像ダウンロード失敗: {response.status}")
+                return None
+            
+            image_data = await response.read()
+        
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_seconds", elapsed, stage="download")
+        self.stats["download_count"] += 1
+        self.stats["download_time"] += elapsed
+        self.stats["download_bytes"] += len(image_data)
+        logger.info(f"画像ダウンロード完了: {len(image_data) / 1024:.0f}KB {elapsed:.2f}s")
+        return image_data
+    
+    def _prepare_image_sync(self, image_data: bytes) -> Tuple[Dict, Optional[int], Dict]:
+        """縮小・再エンコードとキャッシュ用ハッシュ計算（スレッドで実行）"""
+        data, mime_type, prep_stats = preprocess_image(image_data)
+        
+        try:
+            image_hash = compute_dhash(data)
+        except Exception as e:
+            logger.warning(f"画像ハッシュ計算エラー: {e}")
+            image_hash = None
+        
+        return {"mime_type": mime_type, "data": data}, image_hash, prep_stats
+    
+    def _record_preprocess(self, prep_stats: Dict):
+        """前処理の統計を記録"""
+        metrics.observe("stage_seconds", prep_stats["elapsed"], stage="preprocess")
+        self.stats["preprocess_count"] += 1
+        self.stats["preprocess_time"] += prep_stats["elapsed"]
+        self.stats["bytes_saved"] += prep_stats["bytes_saved"]
+        logger.info(
+            f"画像前処理: {prep_stats['original_size'][0]}x{prep_stats['original_size'][1]} "
+            f"{prep_stats['original_bytes'] / 1024:.0f}KB -> "
+            f"{prep_stats['processed_size'][0]}x{prep_stats['processed_size'][1]} "
+            f"{prep_stats['processed_bytes'] / 1024:.0f}KB ({prep_stats['elapsed']:.2f}s)"
+        )
+    
+    def _parse_result(self, text: str) -> Optional[Dict]:
+        """
+        1枚分の応答をパースして検証
+        
+        Raises:
+            json.JSONDecodeError: 応答からJSONを取り出せない場合
+        """
+        with metrics.timer("stage_seconds", stage="parse"):
+            return validate_meal_result(extract_json(text, "{"))
+    
+    async def analyze_meal_image(self, image_url: str,
+                                 on_progress: Optional[Callable[[Dict], None]] = None) -> Tuple[bool, Optional[Dict]]:
         """
         食事画像を分析して栄養情報を抽出
         
         Args:
             image_url: 分析する画像のURL
+            on_progress: 指定するとストリーミングで応答を受信し、説明やカロリーが
+                確定するたびに確定済みの項目の辞書を渡して呼び出す（待たずに戻ること）
             
         Returns:
             (成功フラグ, 分析結果または None)
         """
+        return await self._analyze_with_retry(image_url, on_progress=on_progress)
+    
+    async def _analyze_with_retry(self, image_url: str, prepared: Optional[Tuple[Dict, Optional[int]]] = None,
+                                  on_progress: Optional[Callable[[Dict], None]] = None) -> Tuple[bool, Optional[Dict]]:
+        """
+        再試行付きで1枚を分析（preparedを渡すとダウンロードと前処理を省略する）
+        
+        レート制限・サーバーエラーなどの一時的なエラーだけをジッター付きの間隔で
+        再試行する。Geminiのサーキットブレーカーが開いている場合や、再試行しても
+        一時的なエラーが続いてブレーカーが開いた場合はCircuitOpenErrorを送出する。
+        """
+        delay = 0.0
         for attempt in range(MAX_RETRY_ATTEMPTS + 1):
             try:
-                # 画像をダウンロード
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(image_url) as response:
-                        if response.status != 200:
-                            logger.error(f"画像ダウンロード失敗: {response.status}")
-                            return False, None
-                        
-                        image_data = await response.read()
-                
-                # Geminiで分析（同期的な呼び出しを非同期でラップ）
-                response = await asyncio.to_thread(
-                    self._analyze_image_sync,
-                    image_data
-                )
-                
-                # JSON形式で結果をパース
-                try:
-                    # レスポンスからJSON部分を抽出
-                    text = response.text.strip()
-                    # マークダウンのコードブロックを除去
-                    if text.startswith('```json'):
-                        text = text[7:]
-                    if text.startswith('```'):
-                        text = text[3:]
-                    if text.endswith('```'):
-                        text = text[:-3]
-                    
-                    result = json.loads(text.strip())
+                # ダウンロードと前処理は成功するまでの1回だけ行い、再試行では使い回す
+                if prepared is None:
+                    image_data = await self._download_image(image_url)
+                    if image_data is None:
+                        metrics.inc("analysis_failures_total", reason="download")
+                        return False, None
                     
-                    # エラーチェック
-                    if "error" in result:
-                        logger.warning(f"分析エラー: {result['error']}")
-                        return False, {"error": result['error']}
+                    image_blob, image_hash, prep_stats = await asyncio.to_thread(
+                        self._prepare_image_sync,
+                        image_data
+                    )
+                    self._record_preprocess(prep_stats)
+                    prepared = (image_blob, image_hash)
                     
-                    # 必須フィールドの確認
-                    required_fields = ["meal_description", "estimated_calories", "nutrients"]
-                    if all(field in result for field in required_fields):
-                        logger.info("画像分析成功")
-                        return True, result
-                    else:
-                        logger.error("必須フィールドが不足しています")
-                        return False, None
-                        
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON解析エラー: {e}")
-                    logger.error(f"レスポンステキスト: {response.text}")
-                    if attempt < MAX_RETRY_ATTEMPTS:
-                        await asyncio.sleep(2 ** attempt)  # 指数バックオフ
-                        continue
-                    return False, None
+                    # 同一・類似画像の分析結果があればGeminiを呼ばずに返す
+                    if image_hash is not None:
+                        cached = self.cache.get(image_hash)
+                        if cached is not None:
+                            logger.info(f"分析キャッシュヒット: {image_hash:016x}")
+                            return True, cached
+                
+                image_blob, image_hash = prepared
+                success, result, retry = await self._analyze_prepared(image_blob, image_hash, on_progress)
+                if not retry:
+                    return success, result
+                if attempt < MAX_RETRY_ATTEMPTS:
+                    # 応答の形式不正はレート制限ではないので待たずに再試行
+                    metrics.inc("gemini_retries_total", reason="json")
+                    continue
+                metrics.inc("analysis_failures_total", reason="json")
+                return False, None
                     
+            except CircuitOpenError:
+                metrics.inc("analysis_failures_total", reason="circuit_open")
+                raise
             except Exception as e:
                 logger.error(f"画像分析エラー (試行 {attempt + 1}/{MAX_RETRY_ATTEMPTS + 1}): {e}")
-                if attempt < MAX_RETRY_ATTEMPTS:
-                    await asyncio.sleep(2 ** attempt)  # 指数バックオフ
-                else:
+                if not is_transient_error(e):
+                    # リクエスト・応答内容に起因するエラーは再試行しても結果が変わらない
+                    metrics.inc("analysis_failures_total", reason="error")
                     return False, None
+                if attempt < MAX_RETRY_ATTEMPTS:
+                    metrics.inc("gemini_retries_total", reason="rate_limit" if error_status(e) == 429 else "transient")
+                    delay = decorrelated_jitter(delay, cap=GEMINI_RETRY_MAX_DELAY)
+                    await asyncio.sleep(delay)
+                    continue
+                metrics.inc("analysis_failures_total", reason="transient")
+                if self.breaker.state != CircuitBreaker.CLOSED:
+                    raise CircuitOpenError(self.breaker.name, max(self.breaker.retry_after, 1.0))
+                return False, None
         
         return False, None
     
-    def _analyze_image_sync(self, image_data: bytes):
-        """同期的な画像分析（内部使用）"""
-        # 画像をPIL形式に変換
-        from PIL import Image
-        import io
+    async def _analyze_prepared(self, image_blob: Dict, image_hash: Optional[int],
+                                on_progress: Optional[Callable[[Dict], None]] = None) -> Tuple[bool, Optional[Dict], bool]:
+        """
+        前処理済みの画像をGeminiで1回分析
+        
+        Returns:
+            (成功フラグ, 分析結果または None, 再試行すべきか)
+        """
+        on_text = self._progress_handler(on_progress) if on_progress and GEMINI_STREAMING else None
+        response = await self._generate(
+            [self.prompt_template, image_blob],
+            on_text=on_text,
+            generation_config=self.stream_generation_config if on_text else self.generation_config
+        )
+        
+        try:
+            result = self._parse_result(response.text)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON解析エラー: {e}")
+            logger.error(f"レスポンステキスト: {response.text}")
+            return False, None, True
+        
+        if result is None:
+            logger.error("必須フィールドが不足しています")
+            metrics.inc("analysis_failures_total", reason="missing_fields")
+            return False, None, False
+        
+        # エラーチェック
+        if "error" in result:
+            logger.warning(f"分析エラー: {result['error']}")
+            metrics.inc("analysis_failures_total", reason="not_meal")
+            return False, result, False
+        
+        logger.info("画像分析成功")
+        if image_hash is not None:
+            self.cache.put(image_hash, result)
+        return True, result, False
+    
+    @staticmethod
+    def _progress_handler(on_progress: Callable[[Dict], None]) -> Callable[[str], None]:
+        """受信済みテキストから新しく確定した項目があればon_progressを呼び出す"""
+        seen: Dict = {}
+        
+        def on_text(text: str):
+            fields = extract_partial_fields(text)
+            if fields and fields != seen:
+                seen.update(fields)
+                on_progress(dict(seen))
+        
+        return on_text
+    
+    async def _generate(self, contents: List, on_text: Optional[Callable[[str], None]] = None,
+                        generation_config: Optional[genai.GenerationConfig] = None):
+        """
+        Geminiの非同期APIで画像を分析
+
+        同時実行数はセマフォで制限し、IMAGE_ANALYSIS_TIMEOUTを超えたらキャンセルする。
+        on_textを指定するとストリーミングで受信し、チャンクごとに受信済みの全文を渡す。
+        generation_configで応答のMIMEタイプとスキーマを指定する。
+        サーキットブレーカーが開いている場合は呼び出さずにCircuitOpenErrorを送出する。
+        """
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                with self.breaker.guard():
+                    metrics.inc_daily("gemini_requests_daily")
+                    # 前処理済みの画像データをそのまま送信
+                    if on_text is None:
+                        request = self.model.generate_content_async(
+                            contents,
+                            generation_config=generation_config,
+                            request_options={"timeout": IMAGE_ANALYSIS_TIMEOUT}
+                        )
+                    else:
+                        request = self._generate_stream(contents, on_text, start, generation_config)
+                    response = await asyncio.wait_for(request, timeout=IMAGE_ANALYSIS_TIMEOUT)
+            except CircuitOpenError:
+                metrics.inc("gemini_requests_total", result="circuit_open")
+                raise
+            except asyncio.TimeoutError:
+                logger.error(f"Gemini応答タイムアウト ({IMAGE_ANALYSIS_TIMEOUT}s)")
+                metrics.inc("gemini_requests_total", result="timeout")
+                raise
+            except Exception as e:
+                metrics.inc("gemini_requests_total", result="rate_limited" if error_status(e) == 429 else "error")
+                raise
+        
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_seconds", elapsed, stage="gemini")
+        metrics.inc("gemini_requests_total", result="ok")
+        self.stats["gemini_count"] += 1
+        self.stats["gemini_time"] += elapsed
+        self.stats["upload_bytes"] += sum(len(c["data"]) for c in contents if isinstance(c, dict))
+        logger.info(f"Gemini応答: {elapsed:.2f}s")
+        return response
+    
+    async def _generate_stream(self, contents: List, on_text: Callable[[str], None], start: float,
+                               generation_config: Optional[genai.GenerationConfig] = None) -> StreamedResponse:
+        """ストリーミングで応答を受信してまとめる"""
+        stream = await self.model.generate_content_async(
+            contents,
+            generation_config=generation_config,
+            stream=True,
+            request_options={"timeout": IMAGE_ANALYSIS_TIMEOUT}
+        )
+        text = ""
+        async for chunk in stream:
+            try:
+                piece = chunk.text
+            except ValueError:
+                # テキストを含まないチャンク（安全性フィルタなど）
+                continue
+            if not text:
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="gemini_first_chunk")
+            text += piece
+            on_text(text)
+        return StreamedResponse(text)
+
+    
+    async def _fetch_and_prepare(self, image_url: str) -> Optional[Tuple[Dict, Optional[int]]]:
+        """
+        ダウンロードと前処理（失敗時はNone）
+        
+        タイムアウト・接続エラーなどの一時的なエラーは1枚ずつの分析と同じく
+        ジッター付きの間隔で再試行する。
+        """
+        delay = 0.0
+        for attempt in range(MAX_RETRY_ATTEMPTS + 1):
+            try:
+                image_data = await self._download_image(image_url)
+                if image_data is None:
+                    metrics.inc("analysis_failures_total", reason="download")
+                    return None
+                
+                image_blob, image_hash, prep_stats = await asyncio.to_thread(
+                    self._prepare_image_sync,
+                    image_data
+                )
+                self._record_preprocess(prep_stats)
+                return image_blob, image_hash
+            except Exception as e:
+                logger.error(f"画像準備エラー (試行 {attempt + 1}/{MAX_RETRY_ATTEMPTS + 1}): {e}")
+                if not is_transient_error(e):
+                    metrics.inc("analysis_failures_total", reason="error")
+                    return None
+                if attempt == MAX_RETRY_ATTEMPTS:
+                    metrics.inc("analysis_failures_total", reason="transient")
+                    return None
+                metrics.inc("gemini_retries_total", reason="transient")
+                delay = decorrelated_jitter(delay, cap=GEMINI_RETRY_MAX_DELAY)
+                await asyncio.sleep(delay)
+        return None
+    
+    async def analyze_meal_images(self, image_urls: List[str],
+                                  on_progress: Optional[Callable[[Dict], None]] = None) -> List[Tuple[bool, Optional[Dict]]]:
+        """
+        複数の食事画像をまとめて分析
+        
+        最大GEMINI_BATCH_SIZE枚ずつ1回のリクエストで分析し、
+        応答が検証に失敗した場合は1枚ずつの分析にフォールバックする。
+        
+        Args:
+            image_urls: 分析する画像のURLリスト
+            on_progress: 画像が1枚の場合のみ途中経過の通知に使う（analyze_meal_imageを参照）
+            
+        Returns:
+            画像ごとの (成功フラグ, 分析結果または None) のリスト
+            
+        Raises:
+            CircuitOpenError: Geminiの障害中のため分析できない場合
+        """
+        if len(image_urls) == 1:
+            return [await self.analyze_meal_image(image_urls[0], on_progress=on_progress)]
+        if GEMINI_BATCH_SIZE <= 1:
+            return list(await asyncio.gather(*(self.analyze_meal_image(url) for url in image_urls)))
+        
+        results: List[Optional[Tuple[bool, Optional[Dict]]]] = [None] * len(image_urls)
+        prepared = await asyncio.gather(*(self._fetch_and_prepare(url) for url in image_urls))
+        
+        # キャッシュヒットとダウンロード失敗を先に確定させる
+        pending = []
+        for i, item in enumerate(prepared):
+            if item is None:
+                results[i] = (False, None)
+                continue
+            
+            image_blob, image_hash = item
+            if image_hash is not None:
+                cached = self.cache.get(image_hash)
+                if cached is not None:
+                    logger.info(f"分析キャッシュヒット: {image_hash:016x}")
+                    results[i] = (True, cached)
+                    continue
+            pending.append((i, image_blob, image_hash))
+        
+        fallback = []
+        for start in range(0, len(pending), GEMINI_BATCH_SIZE):
+            batch = pending[start:start + GEMINI_BATCH_SIZE]
+            if len(batch) == 1:
+                fallback.extend(batch)
+                continue
+            
+            batch_results = await self._analyze_batch([blob for _, blob, _ in batch])
+            if batch_results is None:
+                self.stats["batch_fallbacks"] += 1
+                fallback.extend(batch)
+                continue
+            
+            for (i, _, image_hash), result in zip(batch, batch_results):
+                if "error" in result:
+                    results[i] = (False, {"error": result["error"]})
+                else:
+                    if image_hash is not None:
+                        self.cache.put(image_hash, result)
+                    results[i] = (True, result)
+        
+        # 一括分析できなかった画像は前処理済みのデータを使って1枚ずつ分析
+        if fallback:
+            single_results = await asyncio.gather(*(
+                self._analyze_with_retry(image_urls[i], prepared=(image_blob, image_hash))
+                for i, image_blob, image_hash in fallback
+            ))
+            for (i, _, _), result in zip(fallback, single_results):
+                results[i] = result
+        
+        return results
+    
+    async def _analyze_batch(self, image_blobs: List[Dict]) -> Optional[List[Dict]]:
+        """
+        複数画像を1回のリクエストで分析
         
-        image = Image.open(io.BytesIO(image_data))
+        Returns:
+            画像ごとの分析結果（エラー要素を含む）、検証に失敗した場合None
+        """
+        count = len(image_blobs)
+        contents = [self.batch_prompt_template.format(count=count)]
+        for n, blob in enumerate(image_blobs, 1):
+            contents.extend([f"画像{n}:", blob])
+        
+        try:
+            response = await self._generate(contents, generation_config=self.batch_generation_config)
+            with metrics.timer("stage_seconds", stage="parse"):
+                raw_results = extract_json(response.text, "[")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"一括分析エラー ({count}枚): {e}")
+            return None
+        
+        # 要素数と各要素の形式を検証
+        if not isinstance(raw_results, list) or len(raw_results) != count:
+            logger.error(f"一括分析の応答が不正です: 要素数 {len(raw_results) if isinstance(raw_results, list) else '-'}/{count}")
+            return None
+        results = [validate_meal_result(result) for result in raw_results]
+        if any(result is None for result in results):
+            logger.error("一括分析の応答に必須フィールドが不足しています")
+            return None
         
-        # Geminiで分析
-        response = self.model.generate_content([self.prompt_template, image])
-        return response
\ No newline at end of file
+        self.stats["batch_count"] += 1
+        self.stats["batch_images"] += count
+        logger.info(f"一括分析成功: {count}枚")
+        return results
+    
+    @staticmethod
+    def combine_results(results: List[Dict]) -> Dict:
+        """複数画像の分析結果を1食分に合算"""
+        combined_nutrients = {}
+        for key in NUTRIENT_KEYS:
+            total = sum(float(r.get("nutrients", {}).get(key, 0) or 0) for r in results)
+            combined_nutrients[key] = round(total, 1)
+        
+        return {
+            "meal_description": " / ".join(r.get("meal_description", "") for r in results),
+            "estimated_calories": round(sum(float(r.get("estimated_calories", 0) or 0) for r in results)),
+            "nutrients": combined_nutrients,
+            "meal_category": results[0].get("meal_category", "その他"),
+            "health_notes": "\n".join(r.get("health_notes", "") for r in results if r.get("health_notes"))
+        }
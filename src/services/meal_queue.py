@@ -0,0 +1,199 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+from src.config.config import MEAL_WORKER_COUNT, MEAL_QUEUE_MAX_SIZE
+from src.utils.logger import meal_id_var, setup_logger
+
+logger = setup_logger()
+
+
+class MealJob:
+    """分析キューに積まれる1件のジョブ（1投稿分の画像）"""
+
+    def __init__(self, user_id: str, message: Any, attachments: List[Any], status_message: Any = None):
+        self.user_id = user_id
+        self.message = message
+        self.attachments = attachments
+        self.status_message = status_message
+        # ログの相関ID（このジョブの処理中に出力されるログに付与される）
+        self.job_id = uuid.uuid4().hex[:8]
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        # 依存先の障害で後回しにした回数
+        self.deferrals = 0
+
+    @property
+    def wait_time(self) -> float:
+        """キュー投入から処理開始までの待ち時間（秒）"""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class MealQueue:
+    """
+    食事画像分析のジョブキュー
+
+    ユーザーごとにジョブを保持し、ラウンドロビンで取り出すことで
+    1人が大量に投稿しても他のユーザーの分析が待たされないようにする。
+    """
+
+    def __init__(self, handler: Callable[[MealJob], Awaitable[None]],
+                 worker_count: int = MEAL_WORKER_COUNT,
+                 max_size: int = MEAL_QUEUE_MAX_SIZE):
+        self.handler = handler
+        self.worker_count = worker_count
+        self.max_size = max_size
+        self._user_queues: "OrderedDict[str, Deque[MealJob]]" = OrderedDict()
+        self._size = 0
+        self._active = 0
+        self._condition = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._deferred: Set[asyncio.Task] = set()
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "deferred": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    @property
+    def depth(self) -> int:
+        """処理待ちのジョブ数"""
+        return self._size
+
+    @property
+    def deferred(self) -> int:
+        """再投入を待っているジョブ数"""
+        return len(self._deferred)
+
+    @property
+    def active(self) -> int:
+        """処理中のジョブ数"""
+        return self._active
+
+    @property
+    def avg_wait(self) -> float:
+        started = self.stats["processed"] + self.stats["failed"]
+        return self.stats["total_wait"] / started if started else 0.0
+
+    def start(self):
+        """ワーカーを起動（イベントループ上で呼び出すこと）"""
+        if self.running:
+            return
+        for i in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(i), name=f"meal-worker-{i}"))
+        logger.info(f"分析ワーカーを起動しました: {self.worker_count}件")
+
+    async def stop(self):
+        """ワーカーを停止（再投入待ちのジョブは破棄する）"""
+        tasks = self._workers + list(self._deferred)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._deferred.clear()
+        logger.info("分析ワーカーを停止しました")
+
+    async def enqueue(self, job: MealJob) -> bool:
+        """
+        ジョブをキューに追加
+
+        Returns:
+            追加できた場合True、キューが満杯の場合False
+        """
+        if self._size >= self.max_size:
+            self.stats["rejected"] += 1
+            logger.warning(f"分析キューが満杯のためジョブを拒否: user={job.user_id} depth={self._size}")
+            return False
+
+        async with self._condition:
+            self._user_queues.setdefault(job.user_id, deque()).append(job)
+            self._size += 1
+            self.stats["enqueued"] += 1
+            self._condition.notify()
+        return True
+
+    def defer(self, job: MealJob, delay: float):
+        """
+        delay秒後にジョブをキューへ再投入
+
+        依存先の障害中に受け付けたジョブを失敗させずに後回しにする。
+        受付済みのジョブなのでキューの上限は適用しない。
+        再投入待ちのジョブはメモリ上にのみ保持し、再起動すると失われる。
+        """
+        job.deferrals += 1
+        self.stats["deferred"] += 1
+        logger.info(f"分析ジョブを後回しにします: user={job.user_id} {delay:.0f}秒後 ({job.deferrals}回目)")
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            async with self._condition:
+                job.enqueued_at = time.monotonic()
+                job.started_at = None
+                self._user_queues.setdefault(job.user_id, deque()).append(job)
+                self._size += 1
+                self._condition.notify()
+
+        task = asyncio.create_task(requeue(), name=f"meal-defer-{job.job_id}")
+        self._deferred.add(task)
+        task.add_done_callback(self._deferred.discard)
+
+    async def _next_job(self) -> MealJob:
+        """ユーザー間でラウンドロビンしながら次のジョブを取り出す"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._size > 0)
+            user_id, jobs = next(iter(self._user_queues.items()))
+            job = jobs.popleft()
+            if jobs:
+                # 同じユーザーの残りジョブは列の最後尾へ
+                self._user_queues.move_to_end(user_id)
+            else:
+                del self._user_queues[user_id]
+            self._size -= 1
+            return job
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._next_job()
+            token = meal_id_var.set(job.job_id)
+            job.started_at = time.monotonic()
+            wait = job.wait_time
+            self.stats["total_wait"] += wait
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+            logger.info(
+                f"分析ジョブ開始 (worker {index}): user={job.user_id} "
+                f"待ち時間={wait:.2f}s 残りキュー={self._size}"
+            )
+
+            self._active += 1
+            try:
+                await self.handler(job)
+                self.stats["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"分析ジョブエラー: {e}")
+            finally:
+                self._active -= 1
+                meal_id_var.reset(token)
+
+    def get_stats(self) -> Dict:
+        """キューの状態を取得"""
+        return {
+            "depth": self.depth,
+            "active": self.active,
+            "waiting_retry": self.deferred,
+            "workers": len(self._workers),
+            "avg_wait": round(self.avg_wait, 2),
+            **{k: (round(v, 2) if isinstance(v, float) else v) for k, v in self.stats.items()}
+        }
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.config.config import TIMEZONE
+from src.utils.json_utils import coerce_number
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 食事記録シートの列（シートの並び順）
+MEAL_HEADERS = [
+    "記録日時", "ユーザーID", "食事内容", "カテゴリ",
+    "推定カロリー", "炭水化物(g)", "タンパク質(g)", "脂質(g)",
+    "食物繊維(g)", "ナトリウム(mg)", "健康メモ", "画像URL"
+]
+
+# 書き込みの重複検知用の列（MEAL_HEADERSの次の列、Sheets書き込みバッファが記録キーを入れる）
+ROW_KEY_HEADER = "記録キー"
+
+NUMERIC_FIELDS = ("calories", "carbohydrates", "protein", "fat", "fiber", "sodium")
+
+
+def parse_recorded_at(text: str) -> Optional[int]:
+    """記録日時（JST）をUNIX時刻に変換"""
+    try:
+        return int(TIMEZONE.localize(datetime.strptime(text, DATETIME_FORMAT)).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def format_recorded_at(timestamp: int) -> str:
+    """UNIX時刻を記録日時（JST）の文字列に変換"""
+    return datetime.fromtimestamp(timestamp, TIMEZONE).strftime(DATETIME_FORMAT)
+
+
+def to_number(value) -> float:
+    """シートの値を数値に変換（空欄や数値を含まない値は0）"""
+    number = coerce_number(value)
+    return number if number is not None else 0.0
+
+
+@dataclass
+class MealRecord:
+    """
+    1件の食事記録
+
+    記録日時はUNIX時刻、栄養素は数値として保持する。シートの行や分析結果からの
+    変換は取り込み時の1回だけ行い、以降は属性をそのまま参照する。
+    """
+
+    __slots__ = (
+        "recorded_at", "user_id", "description", "category",
+        "calories", "carbohydrates", "protein", "fat", "fiber", "sodium",
+        "health_notes", "image_url"
+    )
+
+    recorded_at: int
+    user_id: str
+    description: str
+    category: str
+    calories: float
+    carbohydrates: float
+    protein: float
+    fat: float
+    fiber: float
+    sodium: float
+    health_notes: str
+    image_url: str
+
+    @property
+    def recorded_at_text(self) -> str:
+        return format_recorded_at(self.recorded_at)
+
+    @property
+    def day(self) -> str:
+        """記録日（YYYY-MM-DD、JST）"""
+        return self.recorded_at_text[:10]
+
+    @classmethod
+    def from_analysis(cls, user_id: str, result: Dict, image_url: str,
+                      recorded_at: Optional[int] = None) -> "MealRecord":
+        """Geminiの分析結果から作成（recorded_at省略時は現在時刻）"""
+        nutrients = result.get("nutrients", {})
+        return cls(
+            recorded_at=int(datetime.now(TIMEZONE).timestamp()) if recorded_at is None else recorded_at,
+            user_id=str(user_id),
+            description=result.get("meal_description", ""),
+            category=result.get("meal_category", "その他"),
+            calories=to_number(result.get("estimated_calories", 0)),
+            carbohydrates=to_number(nutrients.get("carbohydrates", 0)),
+            protein=to_number(nutrients.get("protein", 0)),
+            fat=to_number(nutrients.get("fat", 0)),
+            fiber=to_number(nutrients.get("fiber", 0)),
+            sodium=to_number(nutrients.get("sodium", 0)),
+            health_notes=result.get("health_notes", ""),
+            image_url=image_url
+        )
+
+    @classmethod
+    def from_row(cls, values: List) -> Optional["MealRecord"]:
+        """シートの1行から作成（記録日時が不正な行はNone）"""
+        values = (list(values) + [""] * len(MEAL_HEADERS))[:len(MEAL_HEADERS)]
+        recorded_at = parse_recorded_at(values[0])
+        if recorded_at is None:
+            return None
+        return cls(
+            recorded_at,
+            str(values[1]),
+            str(values[2]),
+            str(values[3]),
+            *(to_number(v) for v in values[4:10]),
+            str(values[10]),
+            str(values[11])
+        )
+
+    def to_row(self) -> List:
+        """シートの1行に変換（整数値の栄養素は整数で書き込む）"""
+        numbers = [getattr(self, name) for name in NUMERIC_FIELDS]
+        return [
+            self.recorded_at_text, self.user_id, self.description, self.category,
+            *(int(v) if float(v).is_integer() else v for v in numbers),
+            self.health_notes, self.image_url
+        ]
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from src.config.config import MEAL_REPLICA_DB, REPLICA_TAIL_WINDOW
+from src.services.meal_record import MEAL_HEADERS, NUMERIC_FIELDS, MealRecord, to_number
+from src.utils.periods import period_between
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# レプリカの列（MEAL_HEADERSと同じ並び）
+_COLUMNS = [
+    "recorded_at_text", "user_id", "description", "category",
+    "calories", "carbohydrates", "protein", "fat",
+    "fiber", "sodium", "health_notes", "image_url"
+]
+
+# 日次集計の栄養素（合計と、0より大きい値の件数を保持する）
+ROLLUP_NUTRIENTS = ("calories", "carbohydrates", "protein", "fat", "fiber", "sodium")
+# 日次集計のカテゴリ列
+ROLLUP_CATEGORIES = {"朝食": "breakfast", "昼食": "lunch", "夕食": "dinner", "間食": "snack", "その他": "other"}
+
+_ROLLUP_COLUMNS = (
+    ["meals"]
+    + [f"{n}_{suffix}" for n in ROLLUP_NUTRIENTS for suffix in ("sum", "n")]
+    + list(ROLLUP_CATEGORIES.values())
+)
+
+# meals表から(user_id, day)ごとの集計を作るSELECT（WHERE句は呼び出し側で付与）
+_ROLLUP_SELECT = (
+    "SELECT user_id, substr(recorded_at_text, 1, 10) AS day, COUNT(*), "
+    + ", ".join(
+        f"SUM(CASE WHEN CAST({n} AS REAL) > 0 THEN CAST({n} AS REAL) ELSE 0 END), "
+        f"SUM(CAST({n} AS REAL) > 0)"
+        for n in ROLLUP_NUTRIENTS
+    )
+    + ", "
+    + ", ".join(f"SUM(category = '{category}')" for category in ROLLUP_CATEGORIES)
+    + " FROM meals"
+)
+
+
+def _normalize_cell(value) -> str:
+    """シートの値とBotが書き込んだ値を同じ表現にそろえる（チェックサム用）"""
+    if isinstance(value, bool):
+        return str(value)
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def normalize_rows(rows: List[List]) -> List[List[str]]:
+    """行を列数をそろえた文字列のリストに変換"""
+    width = len(MEAL_HEADERS)
+    return [
+        [_normalize_cell(v) for v in (list(row) + [""] * (width - len(row)))[:width]]
+        for row in rows
+    ]
+
+
+def tail_checksum(rows: List[List]) -> str:
+    """末尾ウィンドウの行のチェックサム"""
+    payload = json.dumps(normalize_rows(rows), ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class MealReplica:
+    """
+    食事記録シートのローカル読み取りレプリカ（SQLite）
+
+    (user_id, recorded_at) のインデックスと日次集計表により、期間指定のレポート用クエリを
+    シート全体のダウンロードなしで実行できる。
+    """
+
+    def __init__(self, db_path: str = MEAL_REPLICA_DB):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        # データバージョン（レポートのメモ化用、プロセス内でのみ有効）
+        # 全体の再構築で世代を進め、(ユーザー, 日)の変更ごとに通番を振る
+        self._generation = 0
+        self._sequence = 0
+        self._day_versions: Dict[str, Dict[str, int]] = {}
+
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # 値の列は型指定なし（シートの値の型をそのまま保持）
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meals ("
+            "row_number INTEGER PRIMARY KEY, recorded_at INTEGER NOT NULL, "
+            + ", ".join(c if c != "user_id" else "user_id TEXT NOT NULL" for c in _COLUMNS)
+            + ")"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_meals_user_time ON meals (user_id, recorded_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_meals_time ON meals (recorded_at)")
+        # ユーザー・日ごとの集計（meals表の変更に合わせて該当日だけ再計算）
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS daily_rollups ("
+            "user_id TEXT NOT NULL, day TEXT NOT NULL, "
+            + ", ".join(f"{c} {'REAL' if c.endswith('_sum') else 'INTEGER'} NOT NULL DEFAULT 0" for c in _ROLLUP_COLUMNS)
+            + ", PRIMARY KEY (user_id, day))"
+        )
+        # 同期位置（最終同期行と末尾ウィンドウ）
+        self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # 数値を文字列のまま保持していた以前のレプリカの値を数値にそろえる
+        self._db.create_function("to_number", 1, to_number, deterministic=True)
+        for column in NUMERIC_FIELDS:
+            self._db.execute(
+                f"UPDATE meals SET {column} = to_number({column}) "
+                f"WHERE typeof({column}) NOT IN ('integer', 'real')"
+            )
+        # 集計表がない状態で作られたレプリカは起動時に集計を作る
+        if (self._db.execute("SELECT COUNT(*) FROM daily_rollups").fetchone()[0] == 0
+                and self._db.execute("SELECT COUNT(*) FROM meals").fetchone()[0] > 0):
+            self._rebuild_rollups()
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM meals").fetchone()[0]
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def synced_rows(self) -> int:
+        """シートから反映済みの最終行番号（ハイウォーターマーク、未同期の場合は1＝ヘッダー行）"""
+        value = self._get_state("synced_rows")
+        return int(value) if value else 1
+
+    @property
+    def tail_rows(self) -> List[List]:
+        """最終同期行までの末尾ウィンドウの行"""
+        value = self._get_state("tail_rows")
+        return json.loads(value) if value else []
+
+    def _set_sync_point(self, synced_rows: int, tail_rows: List[List]):
+        self._set_state("synced_rows", str(synced_rows))
+        self._set_state("tail_rows", json.dumps(normalize_rows(tail_rows[-REPLICA_TAIL_WINDOW:]), ensure_ascii=False))
+
+    def tail_range(self) -> Optional[Tuple[int, int]]:
+        """差分同期時に照合する末尾ウィンドウの行範囲"""
+        synced_rows = self.synced_rows
+        if synced_rows <= 1:
+            return None
+        return max(2, synced_rows - REPLICA_TAIL_WINDOW + 1), synced_rows
+
+    def matches_tail(self, rows: List[List]) -> bool:
+        """シートの末尾ウィンドウが前回同期時から変わっていないか"""
+        return tail_checksum(rows) == tail_checksum(self.tail_rows)
+
+    @staticmethod
+    def _to_params(row_number: int, record: MealRecord) -> tuple:
+        """記録をINSERT用のパラメータに変換"""
+        return (
+            row_number, record.recorded_at, record.recorded_at_text, record.user_id,
+            record.description, record.category,
+            *(getattr(record, name) for name in NUMERIC_FIELDS),
+            record.health_notes, record.image_url
+        )
+
+    def _insert(self, start_row: int, rows: List[List], refresh_rollups: bool = True) -> int:
+        """行を追加（置き換え）し、影響する日の集計を更新"""
+        end_row = start_row + len(rows) - 1
+        # 置き換えられる既存行の日も再集計の対象にする
+        affected = set(self._db.execute(
+            "SELECT user_id, substr(recorded_at_text, 1, 10) FROM meals WHERE row_number BETWEEN ? AND ?",
+            (start_row, end_row)
+        ).fetchall())
+        records = []
+        params = []
+        for offset, values in enumerate(rows):
+            record = MealRecord.from_row(values)
+            if record is None:
+                logger.warning(f"記録日時が不正な行をスキップ: {start_row + offset}行目")
+                continue
+            records.append(record)
+            params.append(self._to_params(start_row + offset, record))
+
+        placeholders = ", ".join(["?"] * (len(_COLUMNS) + 2))
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO meals (row_number, recorded_at, {', '.join(_COLUMNS)}) "
+            f"VALUES ({placeholders})",
+            params
+        )
+
+        if refresh_rollups:
+            affected.update((record.user_id, record.day) for record in records)
+            self._refresh_rollups(affected)
+            self._bump_versions(affected)
+        return len(records)
+
+    def _bump_versions(self, keys):
+        for user_id, day in keys:
+            self._sequence += 1
+            self._day_versions.setdefault(str(user_id), {})[day] = self._sequence
+
+    def data_version(self, user_id: str, start_day: str, end_day: str) -> Tuple[int, int]:
+        """
+        ユーザーの期間内データのバージョン
+
+        期間内の記録が追加・変更されるかレプリカが再構築されると値が変わる。
+
+        Args:
+            start_day: 開始日（YYYY-MM-DD、含む）
+            end_day: 終了日（YYYY-MM-DD、含む）
+        """
+        days = self._day_versions.get(str(user_id), {})
+        latest = max((v for day, v in days.items() if start_day <= day <= end_day), default=0)
+        return self._generation, latest
+
+    def _refresh_rollups(self, keys):
+        """指定した(user_id, 日)の日次集計を再計算"""
+        placeholders = ", ".join(["?"] * (len(_ROLLUP_COLUMNS) + 2))
+        for user_id, day in keys:
+            try:
+                period = period_between(date.fromisoformat(day), date.fromisoformat(day))
+            except ValueError:
+                continue
+            self._db.execute("DELETE FROM daily_rollups WHERE user_id = ? AND day = ?", (user_id, day))
+            self._db.execute(
+                f"INSERT INTO daily_rollups (user_id, day, {', '.join(_ROLLUP_COLUMNS)}) "
+                f"{_ROLLUP_SELECT} WHERE user_id = ? AND recorded_at >= ? AND recorded_at < ? "
+                "AND substr(recorded_at_text, 1, 10) = ? GROUP BY user_id, day",
+                (user_id, period.start_ts, period.end_ts, day)
+            )
+
+    def _rebuild_rollups(self):
+        """日次集計を全件作り直す"""
+        self._db.execute("DELETE FROM daily_rollups")
+        self._db.execute(
+            f"INSERT INTO daily_rollups (user_id, day, {', '.join(_ROLLUP_COLUMNS)}) "
+            f"{_ROLLUP_SELECT} GROUP BY user_id, day"
+        )
+
+    def query_rollups(self, user_id: Optional[str], start_day: str, end_day: str) -> List[Dict]:
+        """
+        期間内の日次集計を取得
+
+        Args:
+            user_id: ユーザーID（Noneで全ユーザー）
+            start_day: 開始日（YYYY-MM-DD、含む）
+            end_day: 終了日（YYYY-MM-DD、含む）
+
+        Returns:
+            user_id, dayと各集計列をキーにした辞書のリスト（日付順）
+        """
+        columns = ", ".join(["user_id", "day"] + _ROLLUP_COLUMNS)
+        if user_id is None:
+            cursor = self._db.execute(
+                f"SELECT {columns} FROM daily_rollups WHERE day BETWEEN ? AND ? ORDER BY day, user_id",
+                (start_day, end_day)
+            )
+        else:
+            cursor = self._db.execute(
+                f"SELECT {columns} FROM daily_rollups WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user_id, start_day, end_day)
+            )
+        names = ["user_id", "day"] + _ROLLUP_COLUMNS
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def replace_all(self, rows: List[List]):
+        """
+        シート全体の値でレプリカを作り直す
+
+        Args:
+            rows: ヘッダー行を除いたシートの値（2行目から）
+        """
+        with self._db:
+            self._db.execute("DELETE FROM meals")
+            count = self._insert(2, rows, refresh_rollups=False)
+            self._rebuild_rollups()
+            self._set_sync_point(1 + len(rows), rows)
+        self._generation += 1
+        self._day_versions.clear()
+        logger.info(f"食事記録レプリカを再構築しました: {count}件")
+
+    def insert_rows(self, start_row: int, rows: List[List]):
+        """
+        シートに追記された行を反映
+
+        最終同期行の直後に続く行であれば同期位置も進める。
+        間に未同期の行がある場合は位置を据え置き、次回の差分同期で取り込む。
+        """
+        with self._db:
+            self._insert(start_row, rows)
+            synced_rows = self.synced_rows
+            if synced_rows > 1 and start_row == synced_rows + 1:
+                self._set_sync_point(start_row + len(rows) - 1, self.tail_rows + rows)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, Optional, Tuple
+import discord
+from src.config.config import REPORT_CACHE_SIZE, TIMEZONE
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class ReportCache:
+    """
+    レポートの分析結果とEmbedのメモ化キャッシュ
+
+    キーにはユーザー・期間とデータバージョンを含めるため、
+    記録が追加されれば自然に別のキーになり、古いエントリはLRUで追い出される。
+    Embedは辞書で保持し、取り出すたびに新しいEmbedを作って返す
+    （タイムスタンプは取り出した時点の日時にする）。
+    """
+
+    def __init__(self, max_size: int = REPORT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[Dict, Dict]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Hashable) -> Optional[Tuple[Dict, discord.Embed]]:
+        """
+        キャッシュから取得
+
+        Returns:
+            (分析結果, Embed)、キャッシュにない場合None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        analysis, payload = entry
+        embed = discord.Embed.from_dict(payload)
+        if embed.timestamp is not None:
+            embed.timestamp = datetime.now(TIMEZONE)
+        return analysis, embed
+
+    def put(self, key: Hashable, analysis: Dict, embed: discord.Embed):
+        """キャッシュに保存（上限を超えたら最も古いエントリを削除）"""
+        self._entries[key] = (analysis, embed.to_dict())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
@@ -1,20 +1,39 @@
 import discord
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
 import statistics
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 from src.config.config import NUTRITION_TARGETS, USER_PROFILE, TIMEZONE
+from src.services.meal_replica import ROLLUP_CATEGORIES
+from src.services.report_cache import ReportCache
 from src.utils.logger import setup_logger
 
 logger = setup_logger()
 
+NUTRIENT_KEYS = ("carbohydrates", "protein", "fat")
+
+
+def group_rollups_by_user(rollups: List[Dict]) -> Dict[str, List[Dict]]:
+    """全ユーザー分の日次集計をユーザーごとに分ける（1回の走査、日付順は維持）"""
+    grouped: Dict[str, List[Dict]] = {}
+    for r in rollups:
+        grouped.setdefault(str(r["user_id"]), []).append(r)
+    return grouped
+
+
 class ReportService:
     def __init__(self):
         self.targets = NUTRITION_TARGETS
         self.user_profile = USER_PROFILE
+        self.cache = ReportCache()
     
-    def analyze_nutrition_data(self, meal_records: List[Dict]) -> Dict:
-        """栄養データを分析"""
-        if not meal_records:
+    def analyze_rollups(self, rollups: List[Dict]) -> Dict:
+        """
+        日次集計から栄養データを分析
+        
+        日次集計は0より大きい値の合計と件数を持つため、
+        生の記録から計算した場合と同じ平均・合計になる（0以下の値は平均・合計から除外）。
+        """
+        if not rollups:
             return {
                 "total_meals": 0,
                 "avg_calories": 0,
@@ -23,56 +42,74 @@ class ReportService:
                 "meal_distribution": {"朝食": 0, "昼食": 0, "夕食": 0, "間食": 0, "その他": 0}
             }
         
-        # データ集計
-        calories = []
-        nutrients = {"carbohydrates": [], "protein": [], "fat": []}
-        meal_categories = {"朝食": 0, "昼食": 0, "夕食": 0, "間食": 0, "その他": 0}
+        def total(name: str) -> float:
+            return sum(r[name] for r in rollups)
         
-        for record in meal_records:
-            # カロリー
-            cal = float(record.get("推定カロリー", 0))
-            if cal > 0:
-                calories.append(cal)
-            
-            # 栄養素
-            carbs = float(record.get("炭水化物(g)", 0))
-            protein = float(record.get("タンパク質(g)", 0))
-            fat = float(record.get("脂質(g)", 0))
-            
-            if carbs > 0:
-                nutrients["carbohydrates"].append(carbs)
-            if protein > 0:
-                nutrients["protein"].append(protein)
-            if fat > 0:
-                nutrients["fat"].append(fat)
-            
-            # カテゴリ
-            category = record.get("カテゴリ", "その他")
-            if category in meal_categories:
-                meal_categories[category] += 1
-        
-        # 平均値計算
-        avg_calories = statistics.mean(calories) if calories else 0
-        avg_nutrients = {
-            "carbohydrates": statistics.mean(nutrients["carbohydrates"]) if nutrients["carbohydrates"] else 0,
-            "protein": statistics.mean(nutrients["protein"]) if nutrients["protein"] else 0,
-            "fat": statistics.mean(nutrients["fat"]) if nutrients["fat"] else 0
-        }
+        calories_sum = float(total("calories_sum"))
+        calories_n = total("calories_n")
         
-        # 合計値計算
-        total_nutrients = {
-            "carbohydrates": sum(nutrients["carbohydrates"]),
-            "protein": sum(nutrients["protein"]),
-            "fat": sum(nutrients["fat"])
-        }
+        avg_nutrients = {}
+        total_nutrients = {}
+        for key in NUTRIENT_KEYS:
+            nutrient_sum = float(total(f"{key}_sum"))
+            count = total(f"{key}_n")
+            avg_nutrients[key] = nutrient_sum / count if count else 0
+            total_nutrients[key] = nutrient_sum
+        
+        meal_categories = {category: int(total(name)) for category, name in ROLLUP_CATEGORIES.items()}
         
         return {
-            "total_meals": len(meal_records),
-            "avg_calories": round(avg_calories),
+            "total_meals": int(total("meals")),
+            "avg_calories": round(calories_sum / calories_n) if calories_n else 0,
             "avg_nutrients": {k: round(v, 1) for k, v in avg_nutrients.items()},
             "total_nutrients": {k: round(v, 1) for k, v in total_nutrients.items()},
             "meal_distribution": meal_categories,
-            "daily_avg_calories": round(sum(calories) / 7) if len(calories) > 0 else 0
+            "daily_avg_calories": round(calories_sum / 7) if calories_n else 0
+        }
+    
+    def compare_periods(self, current: Dict, previous: Dict) -> Dict[str, float]:
+        """2つの期間の分析結果の差分（current - previous）"""
+        return {
+            "daily_avg_calories": current["daily_avg_calories"] - previous["daily_avg_calories"],
+            "total_meals": current["total_meals"] - previous["total_meals"],
+            **{k: round(current["avg_nutrients"][k] - previous["avg_nutrients"][k], 1) for k in NUTRIENT_KEYS}
+        }
+    
+    def find_best_week(self, rollups: List[Dict], min_days: int = 3) -> Optional[Dict]:
+        """
+        期間内で最も目標カロリーに近かった週（月曜始まり）を探す
+        
+        記録日の1日平均カロリーが目標範囲から外れた量が最も小さい週を選び、
+        同じ場合は記録日数の多い週を優先する。記録日数がmin_days未満の週は
+        他に候補がない場合のみ対象にする。
+        
+        Returns:
+            start, end, days, daily_avg_caloriesを持つ辞書（記録がなければNone）
+        """
+        weeks: Dict = {}
+        for r in rollups:
+            day = datetime.strptime(r["day"], "%Y-%m-%d").date()
+            week = weeks.setdefault(day - timedelta(days=day.weekday()), [0, 0.0])
+            week[0] += 1
+            week[1] += r["calories_sum"]
+        if not weeks:
+            return None
+        
+        candidates = [(start, days, calories / days) for start, (days, calories) in weeks.items()]
+        if any(days >= min_days for _, days, _ in candidates):
+            candidates = [c for c in candidates if c[1] >= min_days]
+        
+        def deviation(daily_avg: float) -> float:
+            return (max(self.targets["calories"]["min"] - daily_avg, 0)
+                    + max(daily_avg - self.targets["calories"]["max"], 0))
+        
+        # 外れ量の昇順、記録日数の降順で先頭を採用
+        start, days, daily_avg = min(candidates, key=lambda c: (deviation(c[2]), -c[1]))
+        return {
+            "start": start,
+            "end": start + timedelta(days=6),
+            "days": days,
+            "daily_avg_calories": round(daily_avg)
         }
     
     def generate_health_advice(self, analysis: Dict, period: str = "weekly") -> List[str]:
@@ -125,10 +162,51 @@ class ReportService:
         
         return advice if advice else ["✨ 全体的にバランスの良い食生活です。この調子で続けましょう！"]
     
-    def create_weekly_report_embed(self, user_name: str, week_data: List[Dict], 
-                                  start_date: datetime, end_date: datetime) -> discord.Embed:
-        """週次レポートのEmbed作成"""
-        analysis = self.analyze_nutrition_data(week_data)
+    def weekly_report(self, user_id: str, user_name: str, week_rollups: List[Dict],
+                      start_date: date, end_date: date,
+                      previous_rollups: Optional[List[Dict]] = None,
+                      version: Optional[Tuple] = None) -> Tuple[Dict, discord.Embed]:
+        """
+        週次レポートの分析結果とEmbedを作成
+        
+        versionには前週を含む期間のデータバージョンを渡す。
+        同じバージョンで作成済みであればメモ化した結果を返す。
+        """
+        key = ("weekly", user_id, user_name, start_date, end_date, version)
+        cached = self.cache.get(key) if version is not None else None
+        if cached:
+            return cached
+        
+        analysis = self.analyze_rollups(week_rollups)
+        embed = self.create_weekly_report_embed(
+            user_name, week_rollups, start_date, end_date, previous_rollups, analysis=analysis
+        )
+        if version is not None:
+            self.cache.put(key, analysis, embed)
+        return analysis, embed
+    
+    def monthly_report(self, user_id: str, user_name: str, month_rollups: List[Dict],
+                       year: int, month: int,
+                       version: Optional[Tuple] = None) -> Tuple[Dict, discord.Embed]:
+        """月次レポートの分析結果とEmbedを作成（同じデータバージョンならメモ化した結果を返す）"""
+        key = ("monthly", user_id, user_name, year, month, version)
+        cached = self.cache.get(key) if version is not None else None
+        if cached:
+            return cached
+        
+        analysis = self.analyze_rollups(month_rollups)
+        embed = self.create_monthly_report_embed(user_name, month_rollups, year, month, analysis=analysis)
+        if version is not None:
+            self.cache.put(key, analysis, embed)
+        return analysis, embed
+    
+    def create_weekly_report_embed(self, user_name: str, week_rollups: List[Dict], 
+                                  start_date: date, end_date: date,
+                                  previous_rollups: Optional[List[Dict]] = None,
+                                  analysis: Optional[Dict] = None) -> discord.Embed:
+        """週次レポートのEmbed作成（日次集計から作成し、前週の記録があれば前週比を表示）"""
+        if analysis is None:
+            analysis = self.analyze_rollups(week_rollups)
         advice = self.generate_health_advice(analysis, "weekly")
         
         # Embed作成
@@ -168,6 +246,17 @@ class ReportService:
             inline=True
         )
         
+        # 前週比
+        if previous_rollups:
+            diff = self.compare_periods(analysis, self.analyze_rollups(previous_rollups))
+            embed.add_field(
+                name="📉 前週比",
+                value=f"1日平均カロリー: {diff['daily_avg_calories']:+,} kcal\n"
+                      f"食事回数: {diff['total_meals']:+}回\n"
+                      f"タンパク質（1食あたり）: {diff['protein']:+.1f}g",
+                inline=False
+            )
+        
         # 健康アドバイス
         advice_text = "\n".join(advice[:3])  # 最大3つまで
         embed.add_field(
@@ -191,10 +280,12 @@ class ReportService:
         
         return embed
     
-    def create_monthly_report_embed(self, user_name: str, month_data: List[Dict], 
-                                   year: int, month: int) -> discord.Embed:
-        """月次レポートのEmbed作成"""
-        analysis = self.analyze_nutrition_data(month_data)
+    def create_monthly_report_embed(self, user_name: str, month_rollups: List[Dict], 
+                                   year: int, month: int,
+                                   analysis: Optional[Dict] = None) -> discord.Embed:
+        """月次レポートのEmbed作成（日次集計から作成）"""
+        if analysis is None:
+            analysis = self.analyze_rollups(month_rollups)
         advice = self.generate_health_advice(analysis, "monthly")
         
         # Embed作成
@@ -240,14 +331,27 @@ class ReportService:
             )
         
         # 月間サマリー
-        days_recorded = len(set(r.get("記録日時", "")[:10] for r in month_data))
+        days_recorded = len(month_rollups)
+        daily_calories = [r["calories_sum"] for r in month_rollups]
+        median_calories = float(statistics.median(daily_calories)) if daily_calories else 0.0
         embed.add_field(
             name="📅 記録状況",
             value=f"記録日数: {days_recorded}日\n"
-                  f"1日平均食事回数: {analysis['total_meals'] / max(days_recorded, 1):.1f}回",
+                  f"1日平均食事回数: {analysis['total_meals'] / max(days_recorded, 1):.1f}回\n"
+                  f"1日カロリー中央値: {median_calories:.0f} kcal",
             inline=False
         )
         
+        # ベストウィーク
+        best_week = self.find_best_week(month_rollups)
+        if best_week:
+            embed.add_field(
+                name="🏆 今月のベストウィーク",
+                value=f"{best_week['start'].strftime('%m/%d')} - {best_week['end'].strftime('%m/%d')}\n"
+                      f"1日平均カロリー: {best_week['daily_avg_calories']:,} kcal（記録{best_week['days']}日）",
+                inline=False
+            )
+        
         # 健康アドバイス
         advice_text = "\n".join(advice)
         embed.add_field(
@@ -0,0 +1,63 @@
+import asyncio
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Set
+from src.config.config import SHEETS_MAX_WORKERS, SHEETS_CALL_TIMEOUT
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class SheetsExecutor:
+    """
+    gspreadのブロッキング呼び出しを専用スレッドプールで実行する非同期ファサード
+
+    デフォルトのexecutorとは別のプールを使うため、Sheets APIが遅延しても
+    他のto_thread処理やイベントループを巻き込まない。
+    """
+
+    def __init__(self, max_workers: int = SHEETS_MAX_WORKERS, timeout: float = SHEETS_CALL_TIMEOUT):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        # タイムアウト後もスレッド上で実行が続いている呼び出し
+        self._abandoned: Set[Future] = set()
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        関数をスレッドプールで実行して結果を待つ
+
+        タイムアウトした場合はasyncio.TimeoutErrorを送出する
+        （開始前の呼び出しは取り消すが、実行中のHTTP呼び出し自体はスレッド上で
+        完了まで続くため、書き込みが後から反映されることがある。wait_abandoned()を参照）。
+        """
+        future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._abandoned.add(future)
+                future.add_done_callback(self._abandoned.discard)
+            logger.error(f"Sheets API呼び出しがタイムアウトしました: {getattr(func, '__name__', func)}")
+            raise
+
+    async def wait_abandoned(self, timeout: Optional[float] = None) -> bool:
+        """
+        タイムアウト後もスレッド上で実行が続いている呼び出しの完了を待つ
+
+        Returns:
+            すべて完了した場合True、timeout秒以内に完了しなかった場合False
+        """
+        futures = list(self._abandoned)
+        if not futures:
+            return True
+        done, not_done = await asyncio.wait(
+            [asyncio.wrap_future(f) for f in futures],
+            timeout=timeout or self.timeout
+        )
+        for future in done:
+            # 結果（例外）はタイムアウトした呼び出し元に報告済み
+            future.exception()
+        return not not_done
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,19 +1,61 @@
+import asyncio
+import re
+import time
 import gspread
+from gspread.utils import ValueRenderOption
 from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime
 import json
-from typing import List, Dict, Optional
-from src.config.config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, TIMEZONE
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional, Tuple
+from src.config.config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, REPLICA_MAX_STALENESS
+from src.services.meal_record import MEAL_HEADERS, ROW_KEY_HEADER, MealRecord
+from src.services.meal_replica import MealReplica
+from src.services.sheets_executor import SheetsExecutor
+from src.services.sheets_writer import SheetsWriteBuffer
 from src.utils.logger import setup_logger
+from src.utils.periods import Period
+from src.utils.resilience import CircuitBreaker, CircuitOpenError
+from src.utils.metrics import metrics
 
 logger = setup_logger()
 
+# 記録キーの列（食事記録の列の次）
+ROW_KEY_COLUMN = chr(ord("A") + len(MEAL_HEADERS))
+
 class SheetsService:
     def __init__(self):
         self.sheet_id = GOOGLE_SHEETS_ID
         self.client = None
         self.sheet = None
-        self._initialize_sheets()
+        self.executor = SheetsExecutor()
+        self._worksheets: Dict[str, gspread.Worksheet] = {}
+        self.headers: Optional[List[str]] = None
+        self.api_calls: Counter = Counter()
+        self.breaker = CircuitBreaker("Sheets")
+        # レプリカ（SQLite）の処理は専用の1スレッドで順に実行する
+        # （接続もそのスレッドで作り、起動時の移行や全件の再構築でイベントループを止めない）
+        self._replica_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replica")
+        self._replica: Future = self._replica_executor.submit(MealReplica)
+        self._last_sync: Optional[float] = None
+        self._sync_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        # 認証・シート取得は初回のAPI呼び出し時（またはconnect()）まで遅延
+        self.write_buffer = SheetsWriteBuffer(self._append_rows, find_written=self._find_written_keys)
+    
+    @property
+    def connected(self) -> bool:
+        return self.sheet is not None
+    
+    async def connect(self):
+        """Google Sheetsに接続（接続済みなら何もしない）"""
+        async with self._connect_lock:
+            if self.connected:
+                return
+            started = time.monotonic()
+            with self.breaker.guard():
+                await self.executor.run(self._initialize_sheets)
+            logger.info(f"Google Sheets接続時間: {time.monotonic() - started:.2f}s")
     
     def _initialize_sheets(self):
         """Google Sheetsの初期化"""
@@ -33,6 +75,7 @@ class SheetsService:
             
             # スプレッドシートを開く
             self.sheet = self.client.open_by_key(self.sheet_id)
+            self.api_calls["open_by_key"] += 1
             
             # ワークシートの初期化
             self._setup_worksheets()
@@ -41,96 +84,278 @@ class SheetsService:
             
         except Exception as e:
             logger.error(f"Google Sheets初期化エラー: {e}")
+            # 次回の呼び出しで接続をやり直す
+            self.sheet = None
             raise
     
     def _setup_worksheets(self):
         """必要なワークシートを作成"""
-        worksheet_names = [ws.title for ws in self.sheet.worksheets()]
+        # 一覧で取得したハンドルをキャッシュして以降のworksheet()呼び出しを省く
+        self._worksheets = {ws.title: ws for ws in self.sheet.worksheets()}
+        self.api_calls["worksheets"] += 1
         
         # 食事記録シート
-        if "食事記録" not in worksheet_names:
+        if "食事記録" not in self._worksheets:
             ws = self.sheet.add_worksheet(title="食事記録", rows=1000, cols=20)
-            headers = [
-                "記録日時", "ユーザーID", "食事内容", "カテゴリ", 
-                "推定カロリー", "炭水化物(g)", "タンパク質(g)", "脂質(g)",
-                "食物繊維(g)", "ナトリウム(mg)", "健康メモ", "画像URL"
-            ]
-            ws.append_row(headers)
+            ws.append_row(MEAL_HEADERS + [ROW_KEY_HEADER])
+            self.api_calls["add_worksheet"] += 1
+            self.api_calls["append_row"] += 1
+            self._worksheets["食事記録"] = ws
+            self.headers = list(MEAL_HEADERS)
             logger.info("食事記録シートを作成しました")
     
-    async def add_meal_record(self, user_id: str, meal_data: Dict, image_url: str) -> bool:
-        """食事記録を追加"""
+    def start_writer(self):
+        """書き込みバッファのフラッシャーを開始"""
+        self.write_buffer.start()
+    
+    async def close(self):
+        """未送信の記録を書き込んで終了"""
+        await self.write_buffer.stop()
+        self.executor.shutdown()
         try:
-            worksheet = self.sheet.worksheet("食事記録")
-            
-            # 現在時刻（JST）
-            now = datetime.now(TIMEZONE)
-            
-            # 記録データの準備
-            row_data = [
-                now.strftime("%Y-%m-%d %H:%M:%S"),
-                user_id,
-                meal_data.get("meal_description", ""),
-                meal_data.get("meal_category", "その他"),
-                meal_data.get("estimated_calories", 0),
-                meal_data.get("nutrients", {}).get("carbohydrates", 0),
-                meal_data.get("nutrients", {}).get("protein", 0),
-                meal_data.get("nutrients", {}).get("fat", 0),
-                meal_data.get("nutrients", {}).get("fiber", 0),
-                meal_data.get("nutrients", {}).get("sodium", 0),
-                meal_data.get("health_notes", ""),
-                image_url
-            ]
-            
-            # データを追加
-            worksheet.append_row(row_data)
-            logger.info(f"食事記録を追加: {user_id} - {meal_data.get('meal_description', '')}")
+            await self._run_replica(MealReplica.close)
+        finally:
+            self._replica_executor.shutdown()
+    
+    async def _run_replica(self, func: Callable, *args):
+        """レプリカの処理をレプリカ専用のスレッドで実行（funcの第1引数にレプリカを渡す）"""
+        replica = await asyncio.wrap_future(self._replica)
+        return await asyncio.wrap_future(self._replica_executor.submit(func, replica, *args))
+    
+    async def _get_worksheet(self, title: str = "食事記録") -> gspread.Worksheet:
+        """ワークシートのハンドルを取得（初回のみAPIで検索してキャッシュ）"""
+        if not self.connected:
+            await self.connect()
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            worksheet = await self._call("worksheet", self.sheet.worksheet, title)
+            self._worksheets[title] = worksheet
+        return worksheet
+    
+    async def _call(self, operation: str, func, *args, **kwargs):
+        """
+        Sheets APIを呼び出し、操作ごとの呼び出し回数を記録
+        
+        連続して障害が起きている間はAPIを呼ばずにCircuitOpenErrorを送出する。
+        """
+        try:
+            with self.breaker.guard(), metrics.timer("sheets_call_seconds", op=operation):
+                self.api_calls[operation] += 1
+                return await self.executor.run(func, *args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            metrics.inc("sheets_errors_total", op=operation)
+            raise
+    
+    async def _call_worksheet(self, operation: str, *args, title: str = "食事記録", **kwargs):
+        """
+        キャッシュしたワークシートのメソッドを呼び出す
+        
+        シートが削除・再作成されてハンドルが無効になった場合のみ
+        キャッシュを破棄して1回だけ再取得する。
+        """
+        for attempt in range(2):
+            worksheet = await self._get_worksheet(title)
+            try:
+                return await self._call(operation, getattr(worksheet, operation), *args, **kwargs)
+            except (gspread.exceptions.WorksheetNotFound, gspread.exceptions.APIError) as e:
+                if attempt or not self._is_worksheet_missing(e):
+                    raise
+                logger.warning(f"ワークシートが見つからないためハンドルを再取得します: {title}")
+                self._worksheets.pop(title, None)
+                self.headers = None
+    
+    @staticmethod
+    def _is_worksheet_missing(error: Exception) -> bool:
+        if isinstance(error, gspread.exceptions.WorksheetNotFound):
+            return True
+        # 削除されたシートの範囲指定は400 "Unable to parse range"になる
+        return getattr(error, "code", None) == 400 and "parse range" in str(error)
+    
+    def get_api_stats(self) -> Dict[str, int]:
+        """操作ごとのSheets API呼び出し回数"""
+        return dict(self.api_calls)
+    
+    async def _append_rows(self, rows: List[List]):
+        """複数行をまとめて追加（書き込みバッファから呼び出し）"""
+        response = await self._call_worksheet("append_rows", rows)
+        
+        # 書き込まれた行番号でレプリカにも反映
+        # （シートへの書き込みは成功しているため、レプリカの失敗で書き込みを失敗扱いにしない）
+        start_row = self._parse_start_row(response)
+        if start_row is None:
+            logger.warning("追記先の行番号を取得できないため、次回参照時にレプリカを同期します")
+            self._last_sync = None
+            return response
+        try:
+            await self._run_replica(MealReplica.insert_rows, start_row, rows)
+        except Exception as e:
+            logger.error(f"レプリカへの反映エラー（次回参照時に同期します）: {e}")
+            self._last_sync = None
+        return response
+    
+    async def _find_written_keys(self, keys: List[str]) -> set:
+        """
+        記録キーのうちシートに書き込み済みのものを取得（書き込みバッファから呼び出し）
+        
+        タイムアウトした書き込みがスレッド上でまだ実行中であれば完了を待ってから調べる。
+        調べるのはレプリカに反映済みの最終行付近から末尾までの記録キーの列だけ。
+        """
+        if not await self.executor.wait_abandoned():
+            raise asyncio.TimeoutError("タイムアウトしたSheetsへの書き込みがまだ完了していません")
+        synced_rows = await self._run_replica(lambda replica: replica.synced_rows)
+        start = max(2, synced_rows - self.write_buffer.batch_size + 1)
+        values = await self._call_worksheet(
+            "get_values",
+            f"{ROW_KEY_COLUMN}{start}:{ROW_KEY_COLUMN}"
+        )
+        written = {str(row[0]) for row in values if row} & set(keys)
+        if written:
+            # 失敗扱いの書き込みはレプリカに反映していないため次回参照時に同期する
+            self._last_sync = None
+        return written
+    
+    @staticmethod
+    def _parse_start_row(response: Dict) -> Optional[int]:
+        """append_rowsの応答（例: '食事記録'!A5:L7）から開始行番号を取得"""
+        try:
+            updated_range = response["updates"]["updatedRange"]
+            start_cell = updated_range.split("!")[-1].split(":")[0]
+            return int(re.sub(r"[^0-9]", "", start_cell))
+        except (KeyError, TypeError, ValueError):
+            return None
+    
+    async def add_meal_record(self, record: MealRecord) -> bool:
+        """
+        食事記録を追加
+        
+        記録はローカルのジャーナルに保存され、Sheetsへはバックグラウンドで
+        まとめて書き込まれる。
+        """
+        try:
+            # ジャーナルに保存（Sheetsへの書き込みは非同期）
+            with metrics.timer("stage_seconds", stage="journal"):
+                saved = self.write_buffer.enqueue(record.to_row())
+            if not saved:
+                return False
+            logger.info(f"食事記録を追加: {record.user_id} - {record.description}")
             return True
             
         except Exception as e:
             logger.error(f"食事記録追加エラー: {e}")
             return False
     
-    async def get_weekly_data(self, user_id: str, start_date: datetime, end_date: datetime) -> List[Dict]:
-        """週次データを取得"""
-        try:
-            worksheet = self.sheet.worksheet("食事記録")
-            all_records = worksheet.get_all_records()
+    async def sync_replica(self, full: bool = False):
+        """
+        シートの変更をローカルレプリカに反映
+        
+        通常は最終同期行より後の行だけを取得する差分同期を行う。
+        末尾ウィンドウの内容が前回と異なる（手動編集・削除）場合や
+        full=Trueの場合はシート全体を読み込んで再構築する。
+        """
+        async with self._sync_lock:
+            tail_range = None if full else await self._run_replica(MealReplica.tail_range)
             
-            # 指定期間のユーザーデータをフィルタリング
-            weekly_data = []
-            for record in all_records:
-                record_date = datetime.strptime(record["記録日時"], "%Y-%m-%d %H:%M:%S")
-                record_date = TIMEZONE.localize(record_date)
+            if tail_range is not None:
+                # 末尾ウィンドウは最終同期行まで
+                synced_rows = tail_range[1]
+                tail_values, new_values = await self._call_worksheet(
+                    "batch_get",
+                    [f"A{tail_range[0]}:L{tail_range[1]}", f"A{synced_rows + 1}:L"],
+                    value_render_option=ValueRenderOption.unformatted
+                )
                 
-                if (record["ユーザーID"] == user_id and 
-                    start_date <= record_date <= end_date):
-                    weekly_data.append(record)
-            
-            return weekly_data
+                if await self._run_replica(MealReplica.matches_tail, tail_values):
+                    if new_values:
+                        await self._run_replica(MealReplica.insert_rows, synced_rows + 1, new_values)
+                        logger.info(f"食事記録レプリカを差分同期しました: {len(new_values)}件")
+                    self._last_sync = time.monotonic()
+                    return
+                
+                logger.warning("シートの変更を検知したため食事記録レプリカを再構築します")
             
-        except Exception as e:
-            logger.error(f"週次データ取得エラー: {e}")
-            return []
+            # ヘッダー行も同じ呼び出しで取得して列構成をキャッシュ
+            values = await self._call_worksheet(
+                "get_values",
+                "A1:L",
+                value_render_option=ValueRenderOption.unformatted
+            )
+            self._update_headers(values[0] if values else [])
+            await self._run_replica(MealReplica.replace_all, values[1:])
+            self._last_sync = time.monotonic()
     
-    async def get_monthly_data(self, user_id: str, year: int, month: int) -> List[Dict]:
-        """月次データを取得"""
-        try:
-            worksheet = self.sheet.worksheet("食事記録")
-            all_records = worksheet.get_all_records()
-            
-            # 指定月のユーザーデータをフィルタリング
-            monthly_data = []
-            for record in all_records:
-                record_date = datetime.strptime(record["記録日時"], "%Y-%m-%d %H:%M:%S")
-                
-                if (record["ユーザーID"] == user_id and 
-                    record_date.year == year and 
-                    record_date.month == month):
-                    monthly_data.append(record)
+    def _update_headers(self, headers: List):
+        """列構成をキャッシュし、想定と異なる場合は警告"""
+        self.headers = [str(h) for h in headers]
+        if self.headers[:len(MEAL_HEADERS)] != MEAL_HEADERS:
+            logger.warning(f"食事記録シートの列構成が想定と異なります: {self.headers}")
+    
+    async def _ensure_replica(self):
+        """
+        レプリカが古ければ差分同期する
+        
+        同期に失敗した場合（障害中・タイムアウト・5xxなど）は手元のレプリカの内容で応答する。
+        """
+        if self._last_sync is None or time.monotonic() - self._last_sync > REPLICA_MAX_STALENESS:
+            try:
+                await self.sync_replica()
+            except CircuitOpenError as e:
+                logger.warning(f"レプリカを同期せずに参照します: {e}")
+            except Exception as e:
+                logger.error(f"レプリカの同期に失敗したため同期前の内容で参照します: {e}")
+    
+    async def get_daily_rollups(self, user_id: Optional[str], period: Period) -> List[Dict]:
+        """
+        期間内のユーザー・日ごとの集計を取得
+        
+        Args:
+            user_id: ユーザーID（Noneで全ユーザー）
+            period: 対象期間
             
-            return monthly_data
+        Raises:
+            sqlite3.Error: レプリカを読めない場合（記録なしと区別するため空のリストは返さない）
+        """
+        await self._ensure_replica()
+        return await self._run_replica(
+            MealReplica.query_rollups,
+            user_id,
+            period.first_day.isoformat(),
+            period.last_day.isoformat()
+        )
+    
+    async def get_daily_rollups_with_versions(self, period: Period, version_period: Optional[Period] = None
+                                              ) -> Tuple[List[Dict], Dict[str, Tuple[int, int]]]:
+        """
+        全ユーザーの期間内の日次集計と、集計に含まれるユーザーごとのデータバージョンを取得
+        
+        集計とバージョンはレプリカのスレッドで続けて読むため、間に反映された記録で
+        古い集計が新しいバージョンに対応付けられることはない。
+        
+        Args:
+            period: 集計の対象期間
+            version_period: バージョンの対象期間（省略時はperiod）
             
-        except Exception as e:
-            logger.error(f"月次データ取得エラー: {e}")
-            return []
\ No newline at end of file
+        Raises:
+            sqlite3.Error: レプリカを読めない場合
+        """
+        await self._ensure_replica()
+        version_period = version_period or period
+        
+        def read(replica: MealReplica):
+            rollups = replica.query_rollups(None, period.first_day.isoformat(), period.last_day.isoformat())
+            versions = {
+                str(user_id): replica.data_version(
+                    user_id,
+                    version_period.first_day.isoformat(),
+                    version_period.last_day.isoformat()
+                )
+                for user_id in {r["user_id"] for r in rollups}
+            }
+            return rollups, versions
+        
+        return await self._run_replica(read)
+    
+    async def get_replica_size(self) -> int:
+        """レプリカの記録件数"""
+        return await self._run_replica(len)
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from src.config.config import (
+    SHEETS_JOURNAL_DB,
+    SHEETS_FLUSH_BATCH_SIZE,
+    SHEETS_FLUSH_INTERVAL,
+    SHEETS_MAX_WRITE_ATTEMPTS,
+    SHEETS_RETRY_MAX_DELAY
+)
+from src.utils.logger import setup_logger
+from src.utils.resilience import CircuitOpenError, decorrelated_jitter, is_transient_error
+
+logger = setup_logger()
+
+
+class SheetsWriteBuffer:
+    """
+    Sheetsへの書き込みをまとめて行うライトビハインドバッファ
+
+    追加された行はまずローカルのSQLiteジャーナルに保存し、
+    バックグラウンドのフラッシャーが件数または時間の条件で
+    append_rowsによりまとめて書き込む。書き込みに成功した行だけを
+    ジャーナルから削除するため、クラッシュしても未送信の行は失われない。
+
+    各行には記録キーを付けて末尾の列に書き込む。タイムアウトや接続エラーなど
+    書き込まれたか分からない失敗の後は、find_writtenでシートに既にあるキーを調べ、
+    書き込み済みの行を再送しない。400や403などの恒久的なエラーはまとめて送った行を
+    1行ずつに分けて再試行し、SHEETS_MAX_WRITE_ATTEMPTS回失敗した行は
+    dead_rows表に移して後続の行の書き込みを止めない。
+    """
+
+    def __init__(self, append_rows: Callable[[List[List]], Awaitable[Any]],
+                 journal_path: str = SHEETS_JOURNAL_DB,
+                 batch_size: int = SHEETS_FLUSH_BATCH_SIZE,
+                 flush_interval: float = SHEETS_FLUSH_INTERVAL,
+                 find_written: Optional[Callable[[List[str]], Awaitable[Set[str]]]] = None,
+                 max_attempts: int = SHEETS_MAX_WRITE_ATTEMPTS):
+        self.append_rows = append_rows
+        self.find_written = find_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._retry_delay = 0.0
+        # 直前の書き込みが失敗したが、シートに反映された可能性がある
+        self._uncertain = False
+        self.stats = {
+            "journaled": 0, "flushed": 0, "flush_calls": 0, "flush_errors": 0,
+            "deduplicated": 0, "dead_lettered": 0
+        }
+
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir and not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        self._db = sqlite3.connect(journal_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending_rows ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, created_at REAL NOT NULL, "
+            "row_key TEXT, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        # 記録キー・試行回数の列がない以前のジャーナルに列を追加
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pending_rows)")}
+        if "row_key" not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN row_key TEXT")
+        if "attempts" not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("UPDATE pending_rows SET row_key = lower(hex(randomblob(8))) WHERE row_key IS NULL")
+        # 恒久的なエラーで書き込めなかった行（手動で確認して再投入する）
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_rows ("
+            "id INTEGER PRIMARY KEY, row TEXT NOT NULL, row_key TEXT, created_at REAL NOT NULL, "
+            "error TEXT, failed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        pending = self.pending
+        if pending:
+            logger.info(f"未送信の記録がジャーナルに残っています: {pending}件")
+            # 前回の終了前に書き込んだがジャーナルから削除できていない行があり得る
+            self._uncertain = True
+
+    @property
+    def pending(self) -> int:
+        """ジャーナルに残っている未送信の行数"""
+        return self._db.execute("SELECT COUNT(*) FROM pending_rows").fetchone()[0]
+
+    @property
+    def dead(self) -> int:
+        """恒久的なエラーで書き込みを諦めた行数"""
+        return self._db.execute("SELECT COUNT(*) FROM dead_rows").fetchone()[0]
+
+    def enqueue(self, row: List) -> bool:
+        """
+        行をジャーナルに保存して送信待ちにする
+
+        Returns:
+            ジャーナルへの保存に成功した場合True
+        """
+        try:
+            self._db.execute(
+                "INSERT INTO pending_rows (row, created_at, row_key) VALUES (?, ?, ?)",
+                (json.dumps(row, ensure_ascii=False), time.time(), uuid.uuid4().hex[:16])
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"ジャーナル保存エラー: {e}")
+            return False
+
+        self.stats["journaled"] += 1
+        if self.pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        """フラッシャーを起動（イベントループ上で呼び出すこと）"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run(), name="sheets-flusher")
+            logger.info("Sheets書き込みフラッシャーを開始しました")
+
+    async def stop(self):
+        """フラッシャーを停止し、残りの行を送信"""
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        try:
+            while self.pending and await self.flush():
+                pass
+        except Exception as e:
+            logger.error(f"終了時のSheets書き込みエラー: {e}")
+        self._db.close()
+        logger.info("Sheets書き込みフラッシャーを停止しました")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if not self.pending:
+                continue
+
+            if not await self.flush():
+                # レート制限・障害時はジッター付きのバックオフで待機
+                self._retry_delay = decorrelated_jitter(
+                    self._retry_delay, base=self.flush_interval, cap=SHEETS_RETRY_MAX_DELAY
+                )
+                delay = self._retry_delay
+                logger.warning(f"Sheets書き込みを{delay:.1f}秒後に再試行します（未送信 {self.pending}件）")
+                await asyncio.sleep(delay)
+            elif self.pending >= self.batch_size or self._head_attempts():
+                # 1行ずつ送っている間も待たずに続ける
+                self._wakeup.set()
+
+    def _head_attempts(self) -> int:
+        """ジャーナル先頭の行が恒久的なエラーで失敗した回数"""
+        head = self._db.execute("SELECT attempts FROM pending_rows ORDER BY id LIMIT 1").fetchone()
+        return head[0] if head else 0
+
+    def _load_batch(self) -> Tuple[List[int], List[str], List[List]]:
+        """
+        ジャーナルの先頭から送信する行を読み込む
+
+        先頭の行が恒久的なエラーで失敗したことがあれば、原因の行を特定するため1行だけ送る。
+        """
+        limit = 1 if self._head_attempts() else self.batch_size
+        rows = self._db.execute(
+            "SELECT id, row_key, row FROM pending_rows ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows], [json.loads(r[2]) for r in rows]
+
+    def _delete(self, ids: List[int]):
+        self._db.executemany("DELETE FROM pending_rows WHERE id = ?", [(row_id,) for row_id in ids])
+        self._db.commit()
+
+    async def _skip_written(self, ids: List[int], keys: List[str]) -> Set[str]:
+        """前回の失敗した書き込みでシートに反映済みの行をジャーナルから削除し、そのキーを返す"""
+        written = set(await self.find_written(keys)) & set(keys)
+        self._uncertain = False
+        if written:
+            self._delete([row_id for row_id, key in zip(ids, keys) if key in written])
+            self.stats["deduplicated"] += len(written)
+            logger.warning(f"失敗扱いの書き込みがシートに反映されていたため再送しません: {len(written)}件")
+        return written
+
+    def _record_permanent_failure(self, ids: List[int], error: Exception):
+        """恒久的なエラーの試行回数を記録し、上限に達した行をdead_rows表に移す"""
+        with self._db:
+            self._db.executemany(
+                "UPDATE pending_rows SET attempts = attempts + 1 WHERE id = ?",
+                [(row_id,) for row_id in ids]
+            )
+            if len(ids) > 1:
+                # まとめて送った行のどれが原因か分からないため、以降は1行ずつ送る
+                return
+            moved = self._db.execute(
+                "INSERT INTO dead_rows (id, row, row_key, created_at, error, failed_at) "
+                "SELECT id, row, row_key, created_at, ?, ? FROM pending_rows WHERE id = ? AND attempts >= ?",
+                (str(error), time.time(), ids[0], self.max_attempts)
+            ).rowcount
+            if moved:
+                self._db.execute("DELETE FROM pending_rows WHERE id = ?", (ids[0],))
+        if moved:
+            self.stats["dead_lettered"] += moved
+            logger.error(
+                f"Sheetsに書き込めない行をジャーナルのdead_rows表に移しました: id={ids[0]} "
+                f"（{self.max_attempts}回失敗）"
+            )
+
+    async def flush(self) -> bool:
+        """
+        ジャーナルの先頭からまとめてSheetsに書き込む
+
+        Returns:
+            書き込みに成功した（または送信する行がない）場合True
+        """
+        async with self._flush_lock:
+            ids, keys, rows = self._load_batch()
+            if not rows:
+                return True
+
+            if self._uncertain and self.find_written:
+                try:
+                    written = await self._skip_written(ids, keys)
+                except Exception as e:
+                    logger.warning(f"書き込み済みの行を確認できないため再送を見送ります: {e}")
+                    return False
+                if written:
+                    batch = [(i, k, r) for i, k, r in zip(ids, keys, rows) if k not in written]
+                    ids, keys, rows = [b[0] for b in batch], [b[1] for b in batch], [b[2] for b in batch]
+                if not rows:
+                    self._retry_delay = 0.0
+                    return True
+
+            try:
+                self.stats["flush_calls"] += 1
+                await self.append_rows([row + [key] for row, key in zip(rows, keys)])
+            except CircuitOpenError as e:
+                # 障害中はAPIを呼ばずに待機（ジャーナルの行はそのまま残る）
+                logger.warning(f"Sheetsへの一括書き込みを見送りました: {e}")
+                return False
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                if is_transient_error(e):
+                    # タイムアウト・接続エラーでは書き込まれている可能性がある
+                    self._uncertain = True
+                    logger.error(f"Sheetsへの一括書き込みレート制限/一時的エラー: {e}")
+                else:
+                    logger.error(f"Sheetsへの一括書き込みエラー（恒久的）: {e}")
+                    self._record_permanent_failure(ids, e)
+                return False
+
+            self._delete(ids)
+            self._retry_delay = 0.0
+            self.stats["flushed"] += len(rows)
+            logger.info(f"Sheetsに{len(rows)}件を書き込みました（未送信 {self.pending}件）")
+            return True
+
+    def get_stats(self) -> Dict:
+        return {"pending": self.pending, "dead": self.dead, **self.stats}
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple
+import discord
+from src.config.config import DISCORD_GLOBAL_RATE, DISCORD_MAX_RETRIES, DISCORD_ROUTE_BURST, DISCORD_ROUTE_RATE
+from src.utils.logger import setup_logger
+from src.utils.metrics import metrics
+from src.utils.resilience import decorrelated_jitter
+
+logger = setup_logger()
+
+
+class TokenBucket:
+    """毎秒rate件、間隔を空けずに最大burst件まで許可するトークンバケット"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self) -> float:
+        self._refill()
+        blocked = self._blocked_until - time.monotonic()
+        shortage = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        return max(blocked, shortage, 0.0)
+
+    def try_acquire(self) -> bool:
+        """待たずに取得できる場合だけトークンを1つ取得"""
+        if self._lock.locked() or self._wait_time() > 0:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self) -> float:
+        """
+        トークンを1つ取得するまで待つ（呼び出し順に取得する）
+
+        Returns:
+            待った秒数
+        """
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                wait = self._wait_time()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._tokens -= 1
+        return time.monotonic() - start
+
+    def block(self, seconds: float):
+        """seconds秒間は取得させない（429を受けた場合）"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class _PendingEdit:
+    """送信待ちの編集（後から来た編集は内容だけを差し替える）"""
+
+    def __init__(self, kwargs: Dict):
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class DiscordOutbox:
+    """
+    Discordへの送信（メッセージ送信・編集・入力中表示）のレート制御
+
+    Discordのルート（チャンネルごとの送信・編集・入力中表示）単位のトークンバケットと
+    Bot全体のバケットで送信の間隔を空け、集中した送信は429を受ける前にここで待たせる。
+    同じメッセージへの編集が送信待ちの間に重なった場合は最新の内容だけを送る。
+    """
+
+    def __init__(self, rate: float = DISCORD_ROUTE_RATE, burst: int = DISCORD_ROUTE_BURST,
+                 global_rate: float = DISCORD_GLOBAL_RATE):
+        self.rate = rate
+        self.burst = burst
+        self._global = TokenBucket(global_rate, int(global_rate))
+        self._buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        self._pending_edits: Dict[Any, _PendingEdit] = {}
+        self._typing_tasks: Set[asyncio.Task] = set()
+        self.stats = {"sent": 0, "edited": 0, "coalesced": 0, "typing": 0, "rate_limited": 0}
+
+    def _bucket(self, route: str, channel: Any) -> TokenBucket:
+        key = (route, getattr(channel, "id", id(channel)))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def _request(self, route: str, channel: Any, call: Callable[[], Awaitable]):
+        """ルートとBot全体の送信枠を待ってから送信（429の場合は間隔を空けて再試行）"""
+        bucket = self._bucket(route, channel)
+        delay = 0.0
+        for attempt in range(DISCORD_MAX_RETRIES + 1):
+            waited = await bucket.acquire()
+            waited += await self._global.acquire()
+            metrics.observe("discord_wait_seconds", waited, route=route)
+            try:
+                return await call()
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == DISCORD_MAX_RETRIES:
+                    raise
+                self.stats["rate_limited"] += 1
+                metrics.inc("discord_rate_limited_total", route=route)
+                delay = decorrelated_jitter(delay)
+                bucket.block(delay)
+                logger.warning(f"Discordのレート制限を受けました: route={route} {delay:.1f}秒後に再試行")
+
+    async def send(self, channel: Any, **kwargs) -> Any:
+        """チャンネルにメッセージを送信"""
+        message = await self._request("send", channel, lambda: channel.send(**kwargs))
+        self.stats["sent"] += 1
+        return message
+
+    async def edit(self, message: Any, **kwargs) -> Any:
+        """
+        メッセージを編集
+
+        同じメッセージへの編集が送信待ちであれば、その内容を差し替えて結果を共有する。
+        """
+        key = message.id
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            pending.kwargs = kwargs
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending.future)
+
+        pending = self._pending_edits[key] = _PendingEdit(kwargs)
+
+        async def call():
+            # 送信を始めた後の編集は次の編集として扱う
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            return await message.edit(**pending.kwargs)
+
+        try:
+            result = await self._request("edit", message.channel, call)
+        except Exception as e:
+            pending.future.set_exception(e)
+        else:
+            self.stats["edited"] += 1
+            pending.future.set_result(result)
+        finally:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if not pending.future.done():
+                pending.future.cancel()
+        return await pending.future
+
+    def typing(self, channel: Any):
+        """入力中の表示を開始（送信枠に空きがなければ省略する）"""
+        if not self._bucket("typing", channel).try_acquire() or not self._global.try_acquire():
+            return
+        task = asyncio.create_task(self._trigger_typing(channel))
+        self._typing_tasks.add(task)
+        task.add_done_callback(self._typing_tasks.discard)
+
+    async def _trigger_typing(self, channel: Any):
+        try:
+            await channel.typing()
+            self.stats["typing"] += 1
+        except discord.HTTPException as e:
+            logger.debug(f"入力中の表示に失敗しました: {e}")
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "pending_edits": len(self._pending_edits), "routes": len(self._buckets)}
+
+
+outbox = DiscordOutbox()
+
+metrics.describe("discord_wait_seconds", "Time spent waiting for a Discord rate limit slot in seconds")
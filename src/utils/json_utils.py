@@ -0,0 +1,85 @@
+import json
+import re
+import unicodedata
+from typing import Any, Optional
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+_OPENERS = {'{': '}', '[': ']'}
+
+
+def _balanced_end(text: str, start: int) -> Optional[int]:
+    """textのstart位置の括弧に対応する閉じ括弧の位置（文字列リテラル内は無視）"""
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _OPENERS:
+            stack.append(_OPENERS[char])
+        elif char in ('}', ']'):
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return i
+    return None
+
+
+def extract_json(text: str, opener: str = '{') -> Any:
+    """
+    応答テキストからJSONを取り出す
+
+    全体がJSONとして読めなければ、コードブロックや前後の説明文を無視して
+    openerで始まる最初の対応が取れたJSON（オブジェクトまたは配列）を探す。
+
+    Args:
+        text: モデルの応答テキスト
+        opener: 探すJSONの開き括弧（'{' または '['）
+
+    Returns:
+        パースしたJSONの値
+
+    Raises:
+        json.JSONDecodeError: JSONが見つからない場合
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    start = text.find(opener)
+    while start != -1:
+        end = _balanced_end(text, start)
+        if end is not None:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError as e:
+                error = e
+        start = text.find(opener, start + 1)
+    raise error
+
+
+def coerce_number(value: Any) -> Optional[float]:
+    """
+    数値または数値を含む文字列を数値に変換（"約500"、"1,200kcal"、"５００" など）
+
+    範囲（"400-500"）は最初の数値を使う。数値が含まれなければNone。
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    normalized = unicodedata.normalize('NFKC', value).replace(',', '')
+    match = _NUMBER.search(normalized)
+    return float(match.group()) if match else None
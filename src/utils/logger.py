@@ -1,46 +1,166 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
+from typing import Optional
+from src.config.config import (
+    LOG_DIR,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_BACKUP_COUNT,
+    LOG_MAX_BYTES,
+    LOG_DEBUG_SAMPLE_RATE
+)
+
+# 処理中の食事投稿のID（ログの相関ID、タスク・スレッドに引き継がれる）
+meal_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("meal_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """ログ出力元のコンテキストから相関IDを付与（キューに入れる前に実行）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        meal_id = meal_id_var.get()
+        record.meal_id = meal_id
+        record.meal_tag = f"[{meal_id}] " if meal_id else ""
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUGログを指定した割合だけ残す（INFO以上は常に出力）"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON形式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, "meal_id", None):
+            entry["meal_id"] = record.meal_id
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    日付の切り替わりとファイルサイズの両方でローテーションするハンドラー
+
+    同じ日にサイズ超過で複数回ローテーションした場合は末尾に連番を付ける。
+    保持数（backupCount）を超えた古いファイルは削除される。
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.seek(0, os.SEEK_END)
+        # tell()はバイト位置のため、日本語を含むログも書き込むバイト数で比べる
+        message = self.format(record) + self.terminator
+        return self.stream.tell() + len(message.encode(self.stream.encoding or "utf-8")) >= self.max_bytes
+
+    def rotation_filename(self, default_name: str) -> str:
+        name = default_name
+        index = 1
+        while os.path.exists(name):
+            name = f"{default_name}.{index}"
+            index += 1
+        return name
+
+
+def _create_formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(meal_tag)s%(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def stop_logging():
+    """キューに残ったログを書き出してリスナーを停止"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def setup_logger(name: str = 'discord_meal_bot'):
     """
     ログ設定をセットアップ
+
+    ログはQueueHandler経由で別スレッドのQueueListenerが書き出すため、
+    ファイル書き込みでイベントループをブロックしない。
     """
+    global _listener
+
     # ロガーの設定
     logger = logging.getLogger(name)
-    
+
     # 既にハンドラーがある場合は既存のロガーを返す
     if logger.handlers:
         return logger
-    
-    logger.setLevel(logging.INFO)
-    
+
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    logger.propagate = False
+
     # ログディレクトリの作成
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # ログファイル名
-    log_file = os.path.join(log_dir, f'{datetime.now().strftime("%Y%m%d")}.log')
-    
-    # ファイルハンドラー
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    
-    # コンソールハンドラー
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    
-    # フォーマッター
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+
+    formatter = _create_formatter()
+
+    # ファイルハンドラー（毎日0時とサイズ上限でローテーション）
+    file_handler = SizedTimedRotatingFileHandler(
+        os.path.join(LOG_DIR, 'meal_bot.log'),
+        max_bytes=LOG_MAX_BYTES,
+        when='midnight',
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8'
     )
     file_handler.setFormatter(formatter)
+
+    # コンソールハンドラー
+    console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
-    # ハンドラーを追加
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger
\ No newline at end of file
+
+    # 呼び出し元ではキューに積むだけにする
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    return logger
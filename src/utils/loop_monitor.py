@@ -0,0 +1,53 @@
+import asyncio
+from typing import Dict, Optional
+from src.config.config import LOOP_LAG_CHECK_INTERVAL, LOOP_LAG_WARN_THRESHOLD, LOOP_DEBUG
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class LoopLagMonitor:
+    """
+    イベントループの遅延を監視
+
+    一定間隔でsleepし、予定より起床が遅れた時間をループのブロック時間として計測する。
+    LOOP_DEBUGを有効にするとasyncioのデバッグモードで遅いコールバック名もログに出る。
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_CHECK_INTERVAL, threshold: float = LOOP_LAG_WARN_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"checks": 0, "warnings": 0, "max_lag": 0.0, "last_lag": 0.0}
+
+    def start(self):
+        """監視を開始（イベントループ上で呼び出すこと）"""
+        if self._task and not self._task.done():
+            return
+        loop = asyncio.get_running_loop()
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+
+            self.stats["checks"] += 1
+            self.stats["last_lag"] = lag
+            self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+            if lag > self.threshold:
+                self.stats["warnings"] += 1
+                logger.warning(f"イベントループが{lag:.3f}秒ブロックされました")
+
+    def get_stats(self) -> Dict:
+        return {k: (round(v, 3) if isinstance(v, float) else v) for k, v in self.stats.items()}
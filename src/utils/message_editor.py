@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+import discord
+from src.config.config import STREAM_EDIT_INTERVAL
+from src.utils.discord_outbox import outbox
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class ThrottledEditor:
+    """
+    途中経過を表示するメッセージの編集を間引く
+
+    update()は編集内容を予約するだけで待たずに戻り、バックグラウンドで
+    前回の編集からmin_interval秒以上空けて最新の内容だけを反映する。
+    finish()は予約中の途中経過を破棄し、間隔を待たずに最終内容で編集する
+    （送信中の途中経過の編集があれば、順序が入れ替わらないよう完了を待ってから送る）。
+    messageがNoneの場合は最初の表示をchannelへの送信とし、以降はそのメッセージを編集する。
+    送信・編集はoutboxのレート制御を通して行う。
+    """
+
+    def __init__(self, message: Any, min_interval: float = STREAM_EDIT_INTERVAL, channel: Any = None):
+        self.message = message
+        self.channel = channel
+        self.min_interval = min_interval
+        self.edits = 0
+        self._last_edit: Optional[float] = None
+        self._pending: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._showing = False
+
+    def update(self, **kwargs):
+        """途中経過の編集を予約"""
+        self._pending = kwargs
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _wait_interval(self):
+        if self._last_edit is None:
+            return
+        delay = self._last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _flush(self):
+        while True:
+            await self._wait_interval()
+            if self._pending is None:
+                return
+            kwargs, self._pending = self._pending, None
+            self._showing = True
+            try:
+                await self._show(kwargs)
+            except discord.HTTPException as e:
+                # 途中経過の表示に失敗しても最終結果の編集は続ける
+                logger.warning(f"途中経過の編集に失敗しました: {e}")
+            finally:
+                self._showing = False
+                self.edits += 1
+                self._last_edit = time.monotonic()
+
+    async def finish(self, **kwargs):
+        """最終内容ですぐに編集（まだ送信していなければ送信）"""
+        self._pending = None
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            if not self._showing:
+                # 間隔を待っている途中経過の編集は不要
+                task.cancel()
+            else:
+                # 送信中の途中経過が最終内容より後に反映されないよう完了を待つ
+                # （最初の送信の場合は編集するメッセージもまだない）
+                await task
+        await self._show(kwargs)
+        self._last_edit = time.monotonic()
+
+    async def _show(self, kwargs: Dict):
+        if self.message is None:
+            self.message = await outbox.send(self.channel, **kwargs)
+        else:
+            await outbox.edit(self.message, **kwargs)
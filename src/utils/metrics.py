@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from aiohttp import web
+from src.config.config import METRICS_HOST, METRICS_PORT, METRICS_DAILY_RETENTION, TIMEZONE
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+# 処理時間のヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "meal_bot_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """累積バケット方式のヒストグラム（Prometheusのhistogramと同じ形式）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """バケット内を線形補間した分位点の推定値"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    プロセス内のメトリクス（カウンターとヒストグラム）
+
+    値はメモリ上にのみ保持し、render()でPrometheusのテキスト形式に出力する。
+    日別カウンターは直近METRICS_DAILY_RETENTION日分だけ保持する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._daily: Dict[str, "OrderedDict[str, int]"] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """カウンターを加算"""
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def inc_daily(self, name: str, value: int = 1):
+        """日別（JST）カウンターを加算"""
+        day = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+        with self._lock:
+            days = self._daily.setdefault(name, OrderedDict())
+            days[day] = days.get(day, 0) + value
+            while len(days) > METRICS_DAILY_RETENTION:
+                days.popitem(last=False)
+
+    def observe(self, name: str, value: float, **labels):
+        """ヒストグラムに値を記録"""
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """withブロックの処理時間をヒストグラムに記録（例外時も記録する）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def counter_total(self, name: str) -> float:
+        """ラベルを問わないカウンターの合計"""
+        return sum(self._counters.get(name, {}).values())
+
+    def daily_value(self, name: str, day: Optional[str] = None) -> int:
+        day = day or datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+        return self._daily.get(name, {}).get(day, 0)
+
+    def histogram_summary(self, name: str) -> List[Tuple[Dict[str, str], int, float, float, float]]:
+        """
+        ヒストグラムの要約
+
+        Returns:
+            (ラベル, 件数, 平均, p50, p95) のリスト
+        """
+        with self._lock:
+            return [
+                (dict(key), h.count, h.sum / h.count if h.count else 0.0, h.quantile(0.5), h.quantile(0.95))
+                for key, h in sorted(self._histograms.get(name, {}).items())
+            ]
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{PREFIX}{name}{_format_labels(key)} {value:g}")
+
+            for name, days in sorted(self._daily.items()):
+                self._header(lines, name, "gauge")
+                for day, value in days.items():
+                    lines.append(f"{PREFIX}{name}{_format_labels((('day', day),))} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, ('le', '+Inf'))} {h.count}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {h.sum:.6f}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, metric_type: str):
+        if name in self._help:
+            lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+        lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+
+
+# プロセス全体で共有するメトリクス
+metrics = Metrics()
+metrics.describe("stage_seconds", "Duration of each meal processing stage in seconds")
+metrics.describe("sheets_call_seconds", "Duration of Google Sheets API calls in seconds")
+metrics.describe("gemini_requests_daily", "Gemini API requests per day (JST)")
+
+
+class MetricsServer:
+    """メトリクスをPrometheusのテキスト形式で公開するHTTPサーバー（GET /metrics）"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        """サーバーを起動（ポート0で無効、起動済みなら何もしない）"""
+        if not self.port or self._runner:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error(f"メトリクスサーバー起動エラー: {e}")
+            await runner.cleanup()
+            return
+        self._runner = runner
+        logger.info(f"メトリクスを公開しました: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,88 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Union
+from src.config.config import TIMEZONE
+
+
+def day_start(day: date) -> datetime:
+    """指定日の0時（TIMEZONE、夏時間の切り替えも考慮）"""
+    return TIMEZONE.localize(datetime.combine(day, time.min))
+
+
+@dataclass(frozen=True)
+class Period:
+    """
+    [start, end) の期間（レポートの週・月や任意の日付範囲）
+
+    境界は常にTIMEZONEの0時で、終了は翌日0時（含まない）とする。
+    UNIX時刻のstart_ts / end_tsで記録の範囲検索に、
+    first_day / last_dayで日次集計の検索や表示に使う。
+    """
+
+    first_day: date
+    last_day: date
+
+    @property
+    def start(self) -> datetime:
+        return day_start(self.first_day)
+
+    @property
+    def end(self) -> datetime:
+        return day_start(self.last_day + timedelta(days=1))
+
+    @property
+    def start_ts(self) -> int:
+        return int(self.start.timestamp())
+
+    @property
+    def end_ts(self) -> int:
+        return int(self.end.timestamp())
+
+    @property
+    def days(self) -> int:
+        return (self.last_day - self.first_day).days + 1
+
+    @property
+    def is_month(self) -> bool:
+        return (self.first_day.day == 1
+                and self.first_day.replace(day=1) == self.last_day.replace(day=1)
+                and self.last_day.day == calendar.monthrange(self.last_day.year, self.last_day.month)[1])
+
+    def previous(self) -> "Period":
+        """直前の同じ長さの期間（月単位の期間は前月）"""
+        if self.is_month:
+            last = self.first_day - timedelta(days=1)
+            return month_period(last.year, last.month)
+        shift = timedelta(days=self.days)
+        return Period(self.first_day - shift, self.last_day - shift)
+
+    def extend_to(self, other: "Period") -> "Period":
+        """otherの終了日まで延ばした期間"""
+        return Period(self.first_day, max(self.last_day, other.last_day))
+
+
+def _to_date(value: Union[date, datetime]) -> date:
+    """TIMEZONEでの日付（タイムゾーン付きのdatetimeは変換してから日付を取る）"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(TIMEZONE)
+        return value.date()
+    return value
+
+
+def period_between(first_day: Union[date, datetime], last_day: Union[date, datetime]) -> Period:
+    """開始日から終了日まで（両端の日を含む）の期間"""
+    return Period(_to_date(first_day), _to_date(last_day))
+
+
+def week_period(reference: Optional[Union[date, datetime]] = None, weeks_ago: int = 0) -> Period:
+    """referenceを含む週（月曜始まり）からweeks_ago週前の週（省略時は現在時刻）"""
+    day = _to_date(reference or datetime.now(TIMEZONE))
+    monday = day - timedelta(days=day.weekday() + 7 * weeks_ago)
+    return Period(monday, monday + timedelta(days=6))
+
+
+def month_period(year: int, month: int) -> Period:
+    """指定月の期間"""
+    return Period(date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1]))
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import aiohttp
+from src.config.config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT, RETRY_BASE_DELAY
+from src.utils.logger import setup_logger
+from src.utils.metrics import metrics
+
+logger = setup_logger()
+
+# レート制限・一時的なサーバーエラーのHTTPステータス
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出しを行わなかった"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name}のサーキットブレーカーが開いています（{retry_after:.0f}秒後に再試行）")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """例外に含まれるHTTPステータス（gspread / google-api-core / aiohttp）"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'code', None) or getattr(error, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    依存先の障害による一時的なエラーかどうか
+
+    レート制限（429）・サーバーエラー（5xx）・タイムアウト・接続エラーが該当し、
+    リクエスト内容や応答内容に起因するエラー（400や安全性フィルタなど）は該当しない。
+    """
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, ConnectionError)):
+        return True
+    return error_status(error) in TRANSIENT_STATUS_CODES
+
+
+def decorrelated_jitter(previous: float, base: float = RETRY_BASE_DELAY, cap: float = 60.0) -> float:
+    """
+    次の再試行までの待ち時間（decorrelated jitter）
+
+    base〜直前の待ち時間の3倍の範囲からランダムに選ぶことで、
+    同時に失敗した複数のリクエストの再試行が同じ時刻に集中しないようにする。
+    """
+    return min(cap, random.uniform(base, max(base, previous * 3)))
+
+
+class CircuitBreaker:
+    """
+    依存先ごとのサーキットブレーカー
+
+    連続した一時的エラーがfailure_threshold回に達すると開き、
+    recovery_timeout秒の間は呼び出しを行わずに即座に失敗させる。
+    その後は半開状態になって1件だけ試行を許し、成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.retry_after <= 0:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """試行を再開するまでの秒数（開いていなければ0）"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        self._state = state
+        metrics.inc("circuit_transitions_total", service=self.name, state=state)
+        if state == self.OPEN:
+            logger.warning(f"{self.name}のサーキットブレーカーを開きました（{self.recovery_timeout:.0f}秒間停止）")
+        else:
+            logger.info(f"{self.name}のサーキットブレーカー: {state}")
+
+    def allow(self) -> bool:
+        """呼び出してよいか（半開状態では同時に1件だけ許可）"""
+        if self._state == self.CLOSED:
+            return True
+        if self._state == self.OPEN:
+            if self.retry_after > 0:
+                return False
+            self._transition(self.HALF_OPEN)
+        # 試行中の1件が結果を記録しないまま残った場合も一定時間後には次を許可する
+        if self._probing and time.monotonic() - self._probe_started < self.recovery_timeout:
+            return False
+        self._probing = True
+        self._probe_started = time.monotonic()
+        return True
+
+    def check(self):
+        """呼び出してよいか確認（許可されなければCircuitOpenError）"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, max(self.retry_after, 1.0))
+
+    def record_success(self):
+        self._failures = 0
+        self._probing = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def record(self, error: Optional[BaseException]):
+        """呼び出し結果を記録（一時的でないエラーは依存先が応答したものとして成功扱い）"""
+        if error is not None and is_transient_error(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        withブロックの呼び出しを保護
+
+        開いていればCircuitOpenErrorを送出し、ブロックの結果（例外）を記録する。
+        キャンセルされた場合は結果を記録しない。
+        """
+        self.check()
+        try:
+            yield
+        except Exception as e:
+            self.record(e)
+            raise
+        except BaseException:
+            self._probing = False
+            raise
+        else:
+            self.record_success()
+
+    def get_stats(self):
+        return {"state": self.state, "failures": self._failures, "retry_after": round(self.retry_after, 1)}